@@ -0,0 +1,78 @@
+from aiogram.filters import Filter
+from aiogram.types import CallbackQuery
+from cachetools import TTLCache
+from sqlalchemy import select
+
+from bot.identity import Identity
+from db.engine import get_session
+from db.models import User, Faculty
+
+NOT_ADMIN_TEXT = "Вы не являетесь админом факультета или не привязаны к факультету."
+
+_MISSING = object()
+
+
+class FacultyRecord:
+    """Поля факультета, которые нужны админским обработчикам"""
+
+    __slots__ = ("id", "name", "google_sheet_url", "admin_id")
+
+    def __init__(self, faculty):
+        self.id = faculty.id
+        self.name = faculty.name
+        self.google_sheet_url = faculty.google_sheet_url
+        self.admin_id = faculty.admin_id
+
+
+class AdminResolver:
+    """TTL-кэш tg_id -> (admin, faculty) для админов факультетов.
+
+    Бот сам не меняет Faculty.admin_id: админов назначают скриптами или
+    SQL в другом процессе, и сюда об этом ничего не доходит. Поэтому
+    реальная граница устаревания — ttl: новый или снятый админ становится
+    виден не позже чем через ttl секунд. Кто меняет админа из кода бота,
+    вызывает invalidate() сам.
+    """
+
+    def __init__(self, ttl=300, maxsize=1024):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, tg_id):
+        context = self._cache.get(tg_id)
+        if context is None:
+            async for session in get_session():
+                result = await session.execute(
+                    select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id)
+                )
+                row = result.first()
+                context = (Identity(row[0]), FacultyRecord(row[1])) if row else _MISSING
+            self._cache[tg_id] = context
+        return None if context is _MISSING else context
+
+    def invalidate(self, tg_id=None):
+        if tg_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(str(tg_id), None)
+
+
+class FacultyAdmin(Filter):
+    """Фильтр админских обработчиков: пропускает только админа факультета.
+
+    Остальным отвечает NOT_ADMIN_TEXT ещё до тела обработчика. Админу
+    передаёт в обработчик admin и faculty из кэша AdminResolver.
+    """
+
+    def __init__(self, resolver):
+        self.resolver = resolver
+
+    async def __call__(self, event, event_from_user=None):
+        context = await self.resolver.get(str(event_from_user.id)) if event_from_user else None
+        if context is None:
+            if isinstance(event, CallbackQuery):
+                await event.message.edit_text(NOT_ADMIN_TEXT)
+            else:
+                await event.answer(NOT_ADMIN_TEXT)
+            return False
+        admin, faculty = context
+        return {"admin": admin, "faculty": faculty}
@@ -0,0 +1,39 @@
+from bot.sheets import a1, pad_grid
+
+# Лист доступности: даты в B1:I1, интервалы в A2:A13, сетка B2:I13, ID собесера в A15
+AVAILABILITY_RANGE = "A1:I15"
+N_DATES = 8
+N_TIMES = 12
+
+# Сколько листов запрашивать в одном values:batchGet (ограничение на длину URL)
+BATCH_GET_CHUNK = 40
+
+
+async def fetch_availability_grids(gc, sh, titles):
+    """Сетки всех листов доступности таблицы: {title: rows}, по batchGet на 40 листов"""
+    grids = {}
+    for i in range(0, len(titles), BATCH_GET_CHUNK):
+        chunk = titles[i:i + BATCH_GET_CHUNK]
+        values = await gc.values_batch_get(sh, [a1(title, AVAILABILITY_RANGE) for title in chunk])
+        grids.update(zip(chunk, values))
+    return grids
+
+
+def parse_availability_grid(rows):
+    """Разбирает сетку листа: (user_id, [(date, time_slot), ...]) для ячеек 'могу'.
+
+    Если в A15 нет ID, возвращает (None, []). Нечисловой ID — ValueError.
+    """
+    grid = pad_grid(rows, N_TIMES + 3, N_DATES + 1)
+    user_id_cell = grid[N_TIMES + 2][0].strip()
+    if not user_id_cell:
+        return None, []
+    user_id = int(user_id_cell)
+    dates = grid[0][1:N_DATES + 1]
+    cells = []
+    for row in range(N_TIMES):
+        time_slot = grid[row + 1][0]
+        for col in range(N_DATES):
+            if grid[row + 1][col + 1].strip().lower() == "могу":
+                cells.append((dates[col], time_slot))
+    return user_id, cells
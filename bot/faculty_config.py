@@ -0,0 +1,66 @@
+import time
+
+from sqlalchemy import select
+
+from db.booking import DEFAULT_HOURS_BEFORE_INTERVIEW
+from db.models import User, Faculty, FacultyTimeDelta
+
+
+class FacultyConfig:
+    """Редко меняющиеся настройки факультета, нужные на пути записи и отмены"""
+
+    __slots__ = ("faculty_id", "google_sheet_url", "admin_tg_id", "hours_before_interview", "loaded_at")
+
+    def __init__(self, faculty_id, google_sheet_url, admin_tg_id, hours_before_interview):
+        self.loaded_at = time.monotonic()
+        self.faculty_id = faculty_id
+        self.google_sheet_url = google_sheet_url
+        self.admin_tg_id = admin_tg_id
+        self.hours_before_interview = (
+            hours_before_interview if hours_before_interview is not None else DEFAULT_HOURS_BEFORE_INTERVIEW
+        )
+
+
+class FacultyConfigCache:
+    """Настройки всех факультетов в памяти процесса.
+
+    Загружаются одним запросом при старте; факультет, которого нет в кэше,
+    дочитывается при первом обращении. set_time_delta обновляет запись
+    на месте. Админа и ссылку на таблицу бот не меняет — их правят вне
+    процесса, поэтому граница устаревания для них — ttl: записи старше ttl
+    секунд перечитываются.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._configs = {}
+
+    @staticmethod
+    def _query():
+        return (
+            select(Faculty.id, Faculty.google_sheet_url, User.tg_id, FacultyTimeDelta.hours_before_interview)
+            .outerjoin(User, User.id == Faculty.admin_id)
+            .outerjoin(FacultyTimeDelta, FacultyTimeDelta.faculty_id == Faculty.id)
+        )
+
+    async def load(self, session):
+        result = await session.execute(self._query())
+        self._configs = {row[0]: FacultyConfig(*row) for row in result.all()}
+
+    async def get(self, session, faculty_id):
+        config = self._configs.get(faculty_id)
+        if config is None or time.monotonic() - config.loaded_at > self.ttl:
+            result = await session.execute(self._query().where(Faculty.id == faculty_id))
+            row = result.first()
+            config = FacultyConfig(*row) if row else FacultyConfig(faculty_id, None, None, None)
+            if row:
+                self._configs[faculty_id] = config
+        return config
+
+    def set_hours(self, faculty_id, hours):
+        config = self._configs.get(faculty_id)
+        if config is not None:
+            config.hours_before_interview = hours
+
+    def invalidate(self, faculty_id):
+        self._configs.pop(faculty_id, None)
@@ -0,0 +1,28 @@
+from aiogram import Dispatcher
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.redis import RedisStorage, DefaultKeyBuilder
+
+
+class VKAuth(StatesGroup):
+    waiting_vk_id = State()
+
+class InterviewFSM(StatesGroup):
+    choosing_date = State()
+    choosing_time = State()
+
+class CancelFSM(StatesGroup):
+    waiting_reason = State()
+
+
+def create_dispatcher(fsm_storage="memory", redis_client=None, ttl=None):
+    """Диспетчер с хранилищем FSM: в памяти процесса или в Redis с TTL на состояние и данные"""
+    if fsm_storage == "redis":
+        storage = RedisStorage(
+            redis_client,
+            key_builder=DefaultKeyBuilder(with_bot_id=True),
+            state_ttl=ttl,
+            data_ttl=ttl
+        )
+        # Апдейты одного пользователя обрабатываются по очереди даже на разных репликах
+        return Dispatcher(storage=storage, events_isolation=storage.create_isolation())
+    return Dispatcher()
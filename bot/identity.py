@@ -0,0 +1,65 @@
+from aiogram import BaseMiddleware
+from cachetools import TTLCache
+from sqlalchemy import select
+
+from db.engine import get_session
+from db.models import User
+
+# Маркер «пользователя нет в базе» — незарегистрированные тоже кэшируются
+_MISSING = object()
+
+
+class Identity:
+    """Компактная запись о пользователе бота, не привязанная к сессии"""
+
+    __slots__ = ("id", "tg_id", "first_name", "last_name", "faculty_id",
+                 "is_candidate", "is_sobeser", "is_admin_faculty")
+
+    def __init__(self, user):
+        self.id = user.id
+        self.tg_id = user.tg_id
+        self.first_name = user.first_name
+        self.last_name = user.last_name
+        self.faculty_id = user.faculty_id
+        self.is_candidate = user.is_candidate
+        self.is_sobeser = user.is_sobeser
+        self.is_admin_faculty = user.is_admin_faculty
+
+
+class IdentityCache:
+    """LRU+TTL кэш tg_id -> Identity в памяти процесса.
+
+    Запись живёт ttl секунд, при переполнении вытесняется давно не
+    использованная. Код, меняющий пользователя или его роли, вызывает
+    invalidate(tg_id), чтобы следующий апдейт перечитал его из базы.
+    """
+
+    def __init__(self, ttl=60, maxsize=10000):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, tg_id):
+        identity = self._cache.get(tg_id)
+        if identity is None:
+            async for session in get_session():
+                user = await session.scalar(select(User).where(User.tg_id == tg_id))
+                identity = Identity(user) if user else _MISSING
+            self._cache[tg_id] = identity
+        return None if identity is _MISSING else identity
+
+    def invalidate(self, tg_id):
+        self._cache.pop(str(tg_id), None)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class IdentityMiddleware(BaseMiddleware):
+    """Внешний middleware: один раз на апдейт кладёт в data["identity"] запись отправителя"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    async def __call__(self, handler, event, data):
+        from_user = data.get("event_from_user")
+        data["identity"] = await self.cache.get(str(from_user.id)) if from_user else None
+        return await handler(event, data)
@@ -0,0 +1,89 @@
+import asyncio
+import hashlib
+import logging
+import os
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+from redis.exceptions import RedisError
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class MediaCache:
+    """Кэш Telegram file_id для статических картинок бота.
+
+    Файл загружается в Telegram один раз, полученный file_id сохраняется
+    в Redis под ключом media:<путь>:<sha256 содержимого>, и все следующие
+    отправки идут по нему. Если содержимое файла меняется, меняется и ключ,
+    поэтому картинка загрузится заново. Загрузку под ключ делает только
+    один обработчик: остальные ждут его на блокировке ключа и отправляют
+    уже полученный file_id.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self._digests = {}  # path -> (mtime_ns, size, sha256)
+        self._file_ids = {}  # redis key -> file_id
+        self._locks = {}  # redis key -> asyncio.Lock
+
+    async def _key(self, path):
+        st = os.stat(path)
+        cached = self._digests.get(path)
+        if not cached or cached[:2] != (st.st_mtime_ns, st.st_size):
+            digest = await asyncio.to_thread(_file_digest, path)
+            cached = (st.st_mtime_ns, st.st_size, digest)
+            self._digests[path] = cached
+        return f"media:{path}:{cached[2]}"
+
+    async def _get(self, key):
+        if key in self._file_ids:
+            return self._file_ids[key]
+        try:
+            file_id = await self.redis.get(key)
+        except RedisError as e:
+            logging.warning(f"[MEDIA] Redis недоступен: {e}")
+            return None
+        if file_id:
+            self._file_ids[key] = file_id
+        return file_id
+
+    async def _forget(self, key):
+        self._file_ids.pop(key, None)
+        try:
+            await self.redis.delete(key)
+        except RedisError:
+            pass
+
+    async def answer_photo(self, message, path, **kwargs):
+        """Отправляет картинку по file_id, загружая файл только при первой отправке"""
+        key = await self._key(path)
+        stale = None
+        file_id = await self._get(key)
+        if file_id:
+            try:
+                return await message.answer_photo(file_id, **kwargs)
+            except TelegramBadRequest as e:
+                logging.warning(f"[MEDIA] file_id для {path} больше не принимается, загружаем заново: {e}")
+                stale = file_id
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            file_id = await self._get(key)
+            if file_id is not None and file_id == stale:
+                await self._forget(key)
+                file_id = None
+            if not file_id:
+                sent = await message.answer_photo(FSInputFile(path), **kwargs)
+                file_id = sent.photo[-1].file_id
+                self._file_ids[key] = file_id
+                try:
+                    await self.redis.set(key, file_id)
+                except RedisError as e:
+                    logging.warning(f"[MEDIA] Не удалось сохранить file_id в Redis: {e}")
+                return sent
+        # Пока ждали блокировку, файл загрузил другой обработчик
+        return await message.answer_photo(file_id, **kwargs)
@@ -0,0 +1,143 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from bot.ratelimit import TokenBucket
+
+# Лимит длины одного текстового сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+class _Outgoing:
+    __slots__ = ("text", "kwargs", "future")
+
+    def __init__(self, text, kwargs, future):
+        self.text = text
+        self.kwargs = kwargs
+        self.future = future
+
+
+class Outbox:
+    """Единая очередь исходящих сообщений бота.
+
+    Общее ведро держит бота в пределах global_rate сообщений в секунду,
+    в один чат уходит не чаще раза в per_chat_interval секунд. Подряд
+    идущие сообщения в один чат без клавиатуры и с одинаковыми параметрами
+    склеиваются в одно, пока помещаются в 4096 символов. На RetryAfter
+    очередь замолкает на указанное Telegram время и повторяет отправку.
+    """
+
+    def __init__(self, bot, global_rate=25, per_chat_interval=1.0, workers=8):
+        self.bot = bot
+        self.per_chat_interval = per_chat_interval
+        self.workers = workers
+        self._bucket = TokenBucket(global_rate)
+        self._pending = {}  # chat_id -> deque[_Outgoing]
+        self._next_at = {}  # chat_id -> когда в чат можно писать снова
+        self._ready = []  # куча (время, seq, chat_id) чатов с ожидающими сообщениями
+        self._seq = itertools.count()  # при равном времени порядок постановки, id чатов не сравниваются
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self, timeout=10):
+        """Дожидается отправки очереди (не дольше timeout) и останавливает воркеров"""
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def post(self, chat_id, text, **kwargs):
+        """Ставит сообщение в очередь; future завершится отправленным Message"""
+        # tg_id из базы приходит строкой, message.chat.id — числом: это один и тот же чат
+        chat_id = int(chat_id)
+        future = asyncio.get_running_loop().create_future()
+        # Ошибку доставки забирает тот, кто ждёт future; иначе она только логируется
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        queue = self._pending.get(chat_id)
+        if queue is None:
+            queue = self._pending[chat_id] = deque()
+            self._schedule(chat_id, self._next_at.get(chat_id, 0.0))
+        queue.append(_Outgoing(text, kwargs, future))
+        self.start()
+        return future
+
+    async def send(self, chat_id, text, **kwargs):
+        """Отправляет через очередь и ждёт доставки; ошибки Telegram пробрасываются"""
+        return await self.post(chat_id, text, **kwargs)
+
+    def _schedule(self, chat_id, at):
+        heapq.heappush(self._ready, (at, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    def _take_batch(self, queue):
+        """Снимает с очереди чата первое сообщение и всё, что можно к нему приклеить"""
+        first = queue.popleft()
+        batch = [first]
+        if "reply_markup" in first.kwargs:
+            return first.text, first.kwargs, batch
+        text = first.text
+        while queue:
+            nxt = queue[0]
+            if nxt.kwargs != first.kwargs or len(text) + 2 + len(nxt.text) > MAX_MESSAGE_LENGTH:
+                break
+            text += "\n\n" + nxt.text
+            batch.append(queue.popleft())
+        return text, first.kwargs, batch
+
+    async def _worker(self):
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            at, _, chat_id = self._ready[0]
+            delay = at - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._ready)
+            queue = self._pending.get(chat_id)
+            if not queue:
+                self._pending.pop(chat_id, None)
+                continue
+            text, kwargs, batch = self._take_batch(queue)
+            await self._bucket.acquire()
+            try:
+                message = await self.bot.send_message(chat_id, text, **kwargs)
+            except TelegramRetryAfter as e:
+                logging.warning(f"[OUTBOX] RetryAfter {e.retry_after} с для чата {chat_id}")
+                self._bucket.pause(e.retry_after)
+                queue.extendleft(reversed(batch))
+                self._next_at[chat_id] = time.monotonic() + e.retry_after
+                self._schedule(chat_id, self._next_at[chat_id])
+                continue
+            except Exception as e:
+                logging.error(f"[OUTBOX] Не удалось отправить сообщение в чат {chat_id}: {e}")
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+            else:
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_result(message)
+            self._next_at[chat_id] = time.monotonic() + self.per_chat_interval
+            if queue:
+                self._schedule(chat_id, self._next_at[chat_id])
+            else:
+                self._pending.pop(chat_id, None)
@@ -0,0 +1,110 @@
+import contextvars
+import logging
+import random
+from collections import Counter
+from contextlib import contextmanager
+
+from aiogram import BaseMiddleware
+
+from bot.ratelimit import TokenBucket
+
+# Какая команда сейчас ходит в Sheets — для учёта вызовов
+_command = contextvars.ContextVar("sheets_command", default="-")
+
+# Ответы, после которых запрос стоит повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@contextmanager
+def sheets_command(name):
+    """Помечает вызовы Sheets внутри блока именем команды"""
+    token = _command.set(name)
+    try:
+        yield
+    finally:
+        _command.reset(token)
+
+
+def current_command():
+    return _command.get()
+
+
+class SheetsQuota:
+    """Общий на процесс регулятор квоты Google Sheets API.
+
+    Каждый вызов берёт токен из ведра сервисного аккаунта (чтение и запись
+    считаются отдельно, как в квотах Google) и из ведра своей таблицы.
+    На 429/5xx скорость аккаунта делится пополам и ведро замолкает на
+    экспоненциальную паузу со случайным разбросом; каждый успешный вызов
+    понемногу возвращает скорость к исходной. Вызовы считаются по
+    факультетам и командам.
+    """
+
+    def __init__(self, per_minute=60, per_spreadsheet_per_minute=40, base_delay=1.0, max_delay=64.0):
+        self.max_rate = per_minute / 60
+        self.min_rate = self.max_rate / 8
+        self.per_spreadsheet_rate = per_spreadsheet_per_minute / 60
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._account = {"read": TokenBucket(self.max_rate, 10), "write": TokenBucket(self.max_rate, 10)}
+        self._spreadsheets = {}  # spreadsheet_id -> TokenBucket
+        self._faculties = {}  # spreadsheet_id -> faculty_id
+        self.calls = Counter()  # (faculty_id, command) -> число вызовов
+        self.throttled = Counter()  # (faculty_id, command) -> число 429/5xx
+
+    def bind(self, spreadsheet_id, faculty_id):
+        """Связывает таблицу с факультетом для учёта вызовов"""
+        self._faculties[spreadsheet_id] = faculty_id
+
+    def _key(self, spreadsheet_id):
+        return self._faculties.get(spreadsheet_id), current_command()
+
+    async def acquire(self, kind, spreadsheet_id=None):
+        await self._account[kind].acquire()
+        if spreadsheet_id is not None:
+            bucket = self._spreadsheets.get(spreadsheet_id)
+            if bucket is None:
+                bucket = self._spreadsheets[spreadsheet_id] = TokenBucket(self.per_spreadsheet_rate, 5)
+            await bucket.acquire()
+        self.calls[self._key(spreadsheet_id)] += 1
+
+    def on_success(self, kind):
+        bucket = self._account[kind]
+        if bucket.rate < self.max_rate:
+            bucket.rate = min(self.max_rate, bucket.rate + self.max_rate / 20)
+
+    def on_throttled(self, kind, spreadsheet_id, attempt):
+        """Замедляет аккаунт и возвращает, сколько секунд ждать перед повтором"""
+        self.throttled[self._key(spreadsheet_id)] += 1
+        bucket = self._account[kind]
+        bucket.rate = max(self.min_rate, bucket.rate / 2)
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+        bucket.pause(delay)
+        logging.warning(
+            f"[QUOTA] Sheets ответил ограничением ({kind}), пауза {delay:.1f} с, "
+            f"скорость {bucket.rate * 60:.0f}/мин, команда={current_command()}"
+        )
+        return delay
+
+    def report(self, limit=20):
+        """Текстовая сводка вызовов по факультетам и командам"""
+        lines = []
+        for (faculty_id, command), count in self.calls.most_common(limit):
+            throttled = self.throttled.get((faculty_id, command), 0)
+            lines.append(f"факультет {faculty_id}, {command}: {count} вызовов, ограничений {throttled}")
+        return "\n".join(lines)
+
+
+class SheetsCommandMiddleware(BaseMiddleware):
+    """Помечает вызовы Sheets из обработчика командой или префиксом callback_data"""
+
+    async def __call__(self, handler, event, data):
+        name = None
+        if event.message and event.message.text and event.message.text.startswith("/"):
+            name = event.message.text.split()[0].split("@")[0]
+        elif event.callback_query and event.callback_query.data:
+            name = event.callback_query.data.split(":", 1)[0]
+        if name is None:
+            return await handler(event, data)
+        with sheets_command(name):
+            return await handler(event, data)
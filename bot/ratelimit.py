@@ -0,0 +1,32 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Ведро токенов: не больше rate событий в секунду, всплеск до capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # Пауза не копит токены: после неё ведро начинает с нуля
+        self._tokens = 0
+        self._updated = self._paused_until
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self.capacity, self._tokens + max(0.0, now - self._updated) * self.rate)
+            self._updated = max(now, self._updated)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+from db.engine import get_session
+from db.reminders import claim_due_reminders
+
+
+class ReminderScheduler:
+    """Фоновая рассылка напоминаний о собеседовании за hours_before часов.
+
+    Раз в interval секунд забирает из базы пачку наступивших напоминаний
+    и отправляет её через очередь исходящих сообщений. Следующая пачка
+    берётся только после доставки предыдущей, поэтому темп выборки задаёт
+    очередь, а не база.
+
+    Доставка «не более одного раза»: запись помечается reminded_at до
+    отправки. Если процесс упадёт посреди пачки, неотправленные
+    напоминания из неё потеряются — но не больше batch штук, и никто
+    не получит напоминание дважды.
+    """
+
+    def __init__(self, outbox, hours_before=24, interval=60.0, batch=25):
+        self.outbox = outbox
+        self.hours_before = hours_before
+        self.interval = interval
+        self.batch = batch
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                while await self.tick() == self.batch:
+                    pass
+            except Exception as e:
+                logging.error(f"[REMIND] Ошибка при рассылке напоминаний: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def tick(self):
+        async for session in get_session():
+            due = await claim_due_reminders(session, self.hours_before, self.batch)
+            await session.commit()
+        sends = [
+            self.outbox.send(
+                tg_id,
+                f"⏰ <b>Напоминание о собеседовании</b>\n\n"
+                f"<b>Дата:</b> {date}\n"
+                f"<b>Время:</b> {time_slot}\n\n"
+                f"Если планы изменились, отменить запись можно в /menu.",
+                parse_mode="HTML"
+            )
+            for tg_id, date, time_slot in due
+        ]
+        results = await asyncio.gather(*sends, return_exceptions=True)
+        failed = sum(isinstance(r, Exception) for r in results)
+        if due:
+            logging.info(f"[REMIND] Отправлено напоминаний: {len(due) - failed}, не доставлено: {failed}")
+        return len(due)
@@ -0,0 +1,134 @@
+import logging
+from redis.exceptions import RedisError
+from sqlalchemy import select
+
+from db.models import SlotLimit
+
+# Поле-маркер: хэш факультета прогрет из slot_limits (даже если слотов нет)
+WARM_MARKER = "__warm__"
+
+# Занять место: -1 — хэш не прогрет, 0 — мест нет, 1 — место занято
+RESERVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local left = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+if left <= 0 then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+return 1
+"""
+
+# Вернуть место, только если хэш прогрет и слот в нём есть
+RELEASE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return -1
+end
+return redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+"""
+
+
+def _key(faculty_id):
+    return f"seats:{faculty_id}"
+
+
+def _field(date, time_slot):
+    return f"{date}|{time_slot}"
+
+
+class SeatCounters:
+    """Счётчики свободных мест в Redis поверх таблицы slot_limits.
+
+    Для каждого факультета хранится хэш seats:<faculty_id> с полями
+    "<date>|<time_slot>" -> остаток мест. Меню читают хэш одним HGETALL,
+    запись сначала занимает место Lua-скриптом, а затем подтверждается
+    в Postgres, который остаётся источником истины. При недоступности
+    Redis все методы откатываются на чтение из базы.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self._reserve = redis_client.register_script(RESERVE_SCRIPT)
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+
+    async def _load(self, session, faculty_id):
+        result = await session.execute(
+            select(SlotLimit.date, SlotLimit.time_slot, SlotLimit.limit)
+            .where(SlotLimit.faculty_id == faculty_id)
+            .order_by(SlotLimit.slot_start, SlotLimit.id)
+        )
+        return {(date, time_slot): limit for date, time_slot, limit in result.all()}
+
+    async def warm(self, session, faculty_id):
+        """Перезаписывает хэш факультета значениями из slot_limits"""
+        seats = await self._load(session, faculty_id)
+        mapping = {_field(date, ts): limit for (date, ts), limit in seats.items()}
+        mapping[WARM_MARKER] = 1
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(_key(faculty_id))
+            pipe.hset(_key(faculty_id), mapping=mapping)
+            await pipe.execute()
+        return seats
+
+    async def warm_all(self, session, faculty_ids):
+        for faculty_id in faculty_ids:
+            try:
+                await self.warm(session, faculty_id)
+            except RedisError as e:
+                logging.warning(f"[SEATS] Не удалось прогреть счётчики факультета {faculty_id}: {e}")
+                return
+
+    async def snapshot(self, session, faculty_id):
+        """Остаток мест по всем слотам факультета: {(date, time_slot): limit}"""
+        try:
+            raw = await self.redis.hgetall(_key(faculty_id))
+            if not raw:
+                return await self.warm(session, faculty_id)
+        except RedisError as e:
+            logging.warning(f"[SEATS] Redis недоступен, читаем slot_limits из базы: {e}")
+            return await self._load(session, faculty_id)
+        seats = {}
+        for field, value in raw.items():
+            if field == WARM_MARKER:
+                continue
+            date, time_slot = field.split("|", 1)
+            seats[(date, time_slot)] = int(value)
+        return seats
+
+    async def reserve(self, session, faculty_id, date, time_slot):
+        """Занимает место: True/False, или None если Redis недоступен"""
+        try:
+            result = await self._reserve(keys=[_key(faculty_id)], args=[_field(date, time_slot)])
+            if result == -1:
+                await self.warm(session, faculty_id)
+                result = await self._reserve(keys=[_key(faculty_id)], args=[_field(date, time_slot)])
+        except RedisError as e:
+            logging.warning(f"[SEATS] Redis недоступен при резервировании: {e}")
+            return None
+        return result == 1
+
+    async def release(self, faculty_id, date, time_slot):
+        try:
+            await self._release(keys=[_key(faculty_id)], args=[_field(date, time_slot)])
+        except RedisError as e:
+            logging.warning(f"[SEATS] Redis недоступен при возврате места: {e}")
+
+    async def set(self, faculty_id, date, time_slot, limit):
+        """Записывает актуальный лимит слота после изменения в базе"""
+        try:
+            if await self.redis.exists(_key(faculty_id)):
+                await self.redis.hset(_key(faculty_id), _field(date, time_slot), limit)
+        except RedisError as e:
+            logging.warning(f"[SEATS] Redis недоступен при обновлении лимита: {e}")
+
+    async def sync(self, session, faculty_id, date, time_slot):
+        """Подтягивает лимит одного слота из базы, если счётчик разошёлся с ней"""
+        limit = await session.scalar(
+            select(SlotLimit.limit).where(
+                SlotLimit.faculty_id == faculty_id,
+                SlotLimit.date == date,
+                SlotLimit.time_slot == time_slot
+            )
+        )
+        await self.set(faculty_id, date, time_slot, limit or 0)
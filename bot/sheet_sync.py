@@ -0,0 +1,214 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+from redis.exceptions import RedisError
+
+from bot.quota import sheets_command
+from bot.sheets import a1, data_validation_request
+
+ZAPIS_SHEET = "Записи_2"
+ZAPIS_HEADERS = ["ID", "Имя Фамилия", "Дата", "Время", "Собеседующий 1", "Собеседующий 2", "Любой собесер 1", "Любой собесер 2"]
+
+
+@dataclass
+class BookingRow:
+    user_id: int
+    full_name: str
+    date: str
+    time_slot: str
+    avail_names: list = field(default_factory=list)
+    all_names: list = field(default_factory=list)
+
+    def values(self):
+        return [str(self.user_id), self.full_name, self.date, self.time_slot, "", "", "", ""]
+
+
+def validation_requests(sheet_id, rows, first_row):
+    """Dropdown'ы строк листа начиная с first_row (нумерация с 1).
+
+    E и F — только те, кто может; G и H — все собесеры факультета.
+    Подряд идущие строки с одинаковым списком ставятся одним диапазоном.
+    """
+    requests = []
+    for attr, start_col in (("avail_names", 4), ("all_names", 6)):
+        run_start, run_names = first_row, None
+        for row_num, row in enumerate([*rows, None], start=first_row):
+            names = getattr(row, attr) if row is not None else None
+            if names == run_names:
+                continue
+            if run_names:
+                requests.append(data_validation_request(
+                    sheet_id, run_start - 1, row_num - 1, start_col, start_col + 2, run_names
+                ))
+            run_start, run_names = row_num, names
+    return requests
+
+
+class BookingSheetSync:
+    """Отложенная пакетная запись новых бронирований в лист "Записи_2".
+
+    Обработчик записи только кладёт строку в буфер факультета. Раз в
+    interval секунд буферы сбрасываются: для каждой таблицы старые строки
+    кандидатов удаляются, новые дописываются в конец, а dropdown'ы
+    ставятся одним spreadsheets.batchUpdate плюс одним values.batchUpdate
+    на всю пачку, независимо от числа записей в ней.
+
+    Запись в таблицу факультета всегда идёт под блокировкой процесса.
+    Если передан redis_client (несколько реплик), дополнительно берётся
+    Redis-блокировка: реплики не перемешают строки, вычисляя место для
+    дописывания по одному и тому же столбцу A. Она живёт lock_ttl секунд
+    и продлевается, пока запись идёт, — паузы регулятора квоты бывают
+    дольше любого фиксированного TTL, а упавшая реплика отпустит таблицу
+    не позже чем через lock_ttl. Если Redis недоступен, запись идёт под
+    одной локальной блокировкой, а не откладывается до его возвращения.
+    """
+
+    def __init__(self, sheets_client, spreadsheets, interval=5.0, redis_client=None, lock_ttl=60):
+        self.gc = sheets_client
+        self.spreadsheets = spreadsheets
+        self.interval = interval
+        self.redis = redis_client
+        self.lock_ttl = lock_ttl
+        self._local_locks = {}  # faculty_id -> asyncio.Lock
+        self._pending = {}  # faculty_id -> (sheet_url, {user_id: BookingRow})
+        self._task = None
+        self._flush_lock = asyncio.Lock()
+
+    def enqueue(self, faculty_id, sheet_url, row):
+        _, rows = self._pending.setdefault(faculty_id, (sheet_url, {}))
+        # Повторная запись того же кандидата в пачке заменяет предыдущую
+        rows.pop(row.user_id, None)
+        rows[row.user_id] = row
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        with sheets_command("booking_sync"):
+            await self._flush()
+
+    async def _flush(self):
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            for faculty_id, (sheet_url, rows) in pending.items():
+                try:
+                    async with self._sheet_lock(faculty_id):
+                        await self._write(faculty_id, sheet_url, list(rows.values()))
+                    logging.info(f"[GSHEET] Записано в '{ZAPIS_SHEET}': faculty_id={faculty_id}, строк={len(rows)}")
+                except Exception as e:
+                    logging.error(f"[GSHEET] Ошибка пакетной записи, повторим позже: faculty_id={faculty_id}: {e}")
+                    # Возвращаем строки в буфер, не затирая записи, пришедшие во время сброса
+                    _, current = self._pending.setdefault(faculty_id, (sheet_url, {}))
+                    for row in rows.values():
+                        current.setdefault(row.user_id, row)
+
+    async def rebuild(self, faculty_id, sheet_url, rows):
+        """Пересоздаёт лист "Записи_2" целиком по rows.
+
+        Три запроса при любом числе записей: удаление и создание листа
+        нужного размера, все значения одним values.update и все dropdown'ы
+        одним spreadsheets.batchUpdate.
+        """
+        async with self._sheet_lock(faculty_id):
+            book = await self.spreadsheets.get(faculty_id, sheet_url)
+            sh = book.spreadsheet_id
+            requests = []
+            old_ws = book.worksheet(ZAPIS_SHEET)
+            if old_ws is not None:
+                requests.append({"deleteSheet": {"sheetId": old_ws["sheetId"]}})
+            requests.append({"addSheet": {"properties": {
+                "title": ZAPIS_SHEET,
+                "gridProperties": {"rowCount": max(100, len(rows) + 1), "columnCount": 10}
+            }}})
+            replies = await self.gc.batch_update(sh, requests)
+            self.spreadsheets.invalidate(faculty_id)
+            sheet_id = replies[-1]["addSheet"]["properties"]["sheetId"]
+            await self.gc.values_update(
+                sh, a1(ZAPIS_SHEET, f"A1:H{len(rows) + 1}"), [ZAPIS_HEADERS] + [r.values() for r in rows]
+            )
+            await self.gc.batch_update(sh, validation_requests(sheet_id, rows, 2))
+
+    @asynccontextmanager
+    async def _sheet_lock(self, faculty_id):
+        async with self._local_locks.setdefault(faculty_id, asyncio.Lock()):
+            if self.redis is None:
+                yield
+                return
+            lock = self.redis.lock(f"lock:sheet_sync:{faculty_id}", timeout=self.lock_ttl, blocking_timeout=60)
+            try:
+                acquired = await lock.acquire()
+            except RedisError as e:
+                logging.warning(f"[GSHEET] Redis недоступен, пишем под локальной блокировкой: faculty_id={faculty_id}: {e}")
+                yield
+                return
+            if not acquired:
+                raise TimeoutError(f"Таблица факультета {faculty_id} занята другой репликой")
+            keepalive = asyncio.create_task(self._keep_lock(lock))
+            try:
+                yield
+            finally:
+                keepalive.cancel()
+                await asyncio.gather(keepalive, return_exceptions=True)
+                try:
+                    await lock.release()
+                except RedisError:
+                    logging.warning(f"[GSHEET] Блокировка таблицы факультета {faculty_id} истекла до конца записи")
+
+    async def _keep_lock(self, lock):
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            await lock.reacquire()
+
+    async def _write(self, faculty_id, sheet_url, rows):
+        book = await self.spreadsheets.get(faculty_id, sheet_url)
+        sh = book.spreadsheet_id
+        ws = book.worksheet(ZAPIS_SHEET)
+        if ws is None:
+            logging.warning(f"[GSHEET] Не найден лист '{ZAPIS_SHEET}', создаём")
+            ws = await self.gc.add_worksheet(sh, ZAPIS_SHEET, rows=100, cols=10)
+            self.spreadsheets.invalidate(faculty_id)
+        sheet_id = ws["sheetId"]
+        row_count = ws.get("gridProperties", {}).get("rowCount", 100)
+
+        ids = {str(r.user_id) for r in rows}
+        column_a = await self.gc.values_get(sh, a1(ZAPIS_SHEET, "A:A"))
+        to_delete = [idx for idx, cells in enumerate(column_a, 1) if cells and cells[0] in ids]
+
+        requests = []
+        # Удаляем старые строки снизу вверх, чтобы номера не сдвигались
+        for idx in reversed(to_delete):
+            requests.append({"deleteDimension": {"range": {
+                "sheetId": sheet_id, "dimension": "ROWS", "startIndex": idx - 1, "endIndex": idx
+            }}})
+        first_row = len(column_a) - len(to_delete) + 1
+        last_row = first_row + len(rows) - 1
+        row_count -= len(to_delete)
+        if last_row > row_count:
+            requests.append({"appendDimension": {
+                "sheetId": sheet_id, "dimension": "ROWS", "length": last_row - row_count
+            }})
+        requests.extend(validation_requests(sheet_id, rows, first_row))
+        await self.gc.batch_update(sh, requests)
+        # Число строк листа изменилось — обновляем закэшированные метаданные на месте
+        ws.setdefault("gridProperties", {})["rowCount"] = max(row_count, last_row)
+        await self.gc.values_batch_update(sh, [
+            (a1(ZAPIS_SHEET, f"A{first_row}:H{last_row}"), [r.values() for r in rows])
+        ])
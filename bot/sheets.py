@@ -0,0 +1,305 @@
+import asyncio
+import json
+import re
+import time
+from urllib.parse import quote
+
+import aiohttp
+from cachetools import TTLCache
+from google.auth import crypt, jwt as google_jwt
+
+from bot.quota import SheetsQuota, RETRY_STATUSES
+
+SHEETS_API = "https://sheets.googleapis.com/v4/spreadsheets"
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+JWT_GRANT_TYPE = "urn:ietf:params:oauth:grant-type:jwt-bearer"
+
+_SPREADSHEET_ID_RE = re.compile(r"/spreadsheets/d/([a-zA-Z0-9-_]+)")
+
+
+class SheetsAPIError(Exception):
+    """Ошибка ответа Google Sheets API"""
+
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+
+def spreadsheet_id_from_url(url):
+    match = _SPREADSHEET_ID_RE.search(url)
+    if not match:
+        raise ValueError(f"Не удалось извлечь id таблицы из ссылки: {url}")
+    return match.group(1)
+
+
+def a1(title, cells=None):
+    """Диапазон в A1-нотации с экранированным именем листа: 'Лист'!B1:I1"""
+    quoted = "'" + title.replace("'", "''") + "'"
+    return f"{quoted}!{cells}" if cells else quoted
+
+
+def pad_grid(rows, n_rows, n_cols):
+    """Дополняет обрезанный ответ values.get пустыми ячейками до n_rows x n_cols.
+
+    При n_rows=None число строк не меняется, выравниваются только столбцы.
+    """
+    if n_rows is None:
+        n_rows = len(rows)
+    rows = [list(r) + [""] * (n_cols - len(r)) for r in rows[:n_rows]]
+    rows += [[""] * n_cols for _ in range(n_rows - len(rows))]
+    return [r[:n_cols] for r in rows]
+
+
+def data_validation_request(sheet_id, start_row, end_row, start_col, end_col, values, strict=False):
+    """Запрос setDataValidation с выпадающим списком; индексы с нуля, конец не включается"""
+    rule = {
+        "condition": {
+            "type": "ONE_OF_LIST",
+            "values": [{"userEnteredValue": v} for v in values]
+        },
+        "showCustomUi": True
+    }
+    if strict:
+        rule["strict"] = True
+    return {
+        "setDataValidation": {
+            "range": {
+                "sheetId": sheet_id,
+                "startRowIndex": start_row,
+                "endRowIndex": end_row,
+                "startColumnIndex": start_col,
+                "endColumnIndex": end_col
+            },
+            "rule": rule
+        }
+    }
+
+
+def _error_message(body):
+    """Текст ошибки из JSON-ответа Google, иначе начало тела как есть"""
+    try:
+        return json.loads(body)["error"]["message"]
+    except (ValueError, KeyError, TypeError):
+        return body[:500]
+
+
+class SheetsClient:
+    """Асинхронный клиент Google Sheets API v4 на aiohttp.
+
+    Один экземпляр на процесс: держит пул keep-alive соединений и
+    OAuth-токен сервисного аккаунта, который обновляется за минуту
+    до истечения. Все вызовы неблокирующие и не задерживают диспетчер.
+    Каждый запрос проходит через SheetsQuota; на 429 (а для чтения и на
+    5xx) запрос повторяется до max_retries раз с паузой от регулятора.
+    """
+
+    def __init__(self, credentials_file="credentials.json", quota=None, max_retries=5):
+        self.credentials_file = credentials_file
+        self.quota = quota or SheetsQuota()
+        self.max_retries = max_retries
+        self._session = None
+        self._signer = None
+        self._email = None
+        self._token_uri = None
+        self._token = None
+        self._token_expires = 0.0
+        self._token_lock = asyncio.Lock()
+
+    def _http(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=60)
+            )
+        return self._session
+
+    def _load_credentials(self):
+        with open(self.credentials_file) as f:
+            info = json.load(f)
+        self._signer = crypt.RSASigner.from_service_account_info(info)
+        self._email = info["client_email"]
+        self._token_uri = info.get("token_uri", "https://oauth2.googleapis.com/token")
+
+    async def _access_token(self):
+        if self._token and time.time() < self._token_expires - 60:
+            return self._token
+        async with self._token_lock:
+            if self._token and time.time() < self._token_expires - 60:
+                return self._token
+            if self._signer is None:
+                self._load_credentials()
+            now = int(time.time())
+            assertion = google_jwt.encode(self._signer, {
+                "iss": self._email,
+                "scope": " ".join(SCOPES),
+                "aud": self._token_uri,
+                "iat": now,
+                "exp": now + 3600
+            })
+            async with self._http().post(
+                self._token_uri,
+                data={"grant_type": JWT_GRANT_TYPE, "assertion": assertion.decode()}
+            ) as resp:
+                payload = await resp.json(content_type=None)
+                if resp.status != 200:
+                    raise SheetsAPIError(resp.status, payload.get("error_description") or payload)
+            self._token = payload["access_token"]
+            self._token_expires = now + int(payload.get("expires_in", 3600))
+            return self._token
+
+    async def _request(self, method, url, spreadsheet_id=None, **kwargs):
+        kind = "read" if method == "GET" else "write"
+        attempt = 0
+        while True:
+            await self.quota.acquire(kind, spreadsheet_id)
+            headers = {"Authorization": f"Bearer {await self._access_token()}"}
+            try:
+                async with self._http().request(method, url, headers=headers, **kwargs) as resp:
+                    status = resp.status
+                    # Тело читаем как текст: на 5xx прокси Google отвечает HTML, а не JSON
+                    body = await resp.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # Обрыв соединения или таймаут: чтение повторяем, запись могла и примениться
+                if kind == "read" and attempt < self.max_retries:
+                    await asyncio.sleep(self.quota.on_throttled(kind, spreadsheet_id, attempt))
+                    attempt += 1
+                    continue
+                raise
+            # Запись повторяем только на 429: после 5xx изменение могло и примениться
+            retryable = status == 429 or (kind == "read" and status in RETRY_STATUSES)
+            if retryable and attempt < self.max_retries:
+                await asyncio.sleep(self.quota.on_throttled(kind, spreadsheet_id, attempt))
+                attempt += 1
+                continue
+            if status >= 400:
+                raise SheetsAPIError(status, _error_message(body))
+            self.quota.on_success(kind)
+            return json.loads(body) if body else {}
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    # --- Таблица и листы ---
+
+    async def worksheets(self, spreadsheet_id):
+        """Свойства всех листов таблицы (title, sheetId, gridProperties)"""
+        payload = await self._request(
+            "GET", f"{SHEETS_API}/{spreadsheet_id}", spreadsheet_id,
+            params={"fields": "sheets.properties"}
+        )
+        return [s["properties"] for s in payload.get("sheets", [])]
+
+    async def batch_update(self, spreadsheet_id, requests):
+        if not requests:
+            return []
+        payload = await self._request(
+            "POST", f"{SHEETS_API}/{spreadsheet_id}:batchUpdate", spreadsheet_id,
+            json={"requests": requests}
+        )
+        return payload.get("replies", [])
+
+    async def add_worksheet(self, spreadsheet_id, title, rows=100, cols=10):
+        replies = await self.batch_update(spreadsheet_id, [{
+            "addSheet": {
+                "properties": {
+                    "title": title,
+                    "gridProperties": {"rowCount": int(rows), "columnCount": int(cols)}
+                }
+            }
+        }])
+        return replies[0]["addSheet"]["properties"]
+
+    async def delete_worksheet(self, spreadsheet_id, sheet_id):
+        await self.batch_update(spreadsheet_id, [{"deleteSheet": {"sheetId": sheet_id}}])
+
+    # --- Значения ---
+
+    async def values_get(self, spreadsheet_id, range_):
+        payload = await self._request(
+            "GET", f"{SHEETS_API}/{spreadsheet_id}/values/{quote(range_, safe='')}", spreadsheet_id
+        )
+        return payload.get("values", [])
+
+    async def values_batch_get(self, spreadsheet_id, ranges):
+        """Значения нескольких диапазонов одним запросом, в порядке ranges"""
+        if not ranges:
+            return []
+        payload = await self._request(
+            "GET", f"{SHEETS_API}/{spreadsheet_id}/values:batchGet", spreadsheet_id,
+            params=[("ranges", r) for r in ranges]
+        )
+        return [vr.get("values", []) for vr in payload.get("valueRanges", [])]
+
+    async def values_update(self, spreadsheet_id, range_, values):
+        return await self._request(
+            "PUT", f"{SHEETS_API}/{spreadsheet_id}/values/{quote(range_, safe='')}", spreadsheet_id,
+            params={"valueInputOption": "RAW"},
+            json={"values": values}
+        )
+
+    async def values_batch_update(self, spreadsheet_id, data):
+        """data: [(range, values), ...] — все диапазоны одним запросом"""
+        if not data:
+            return {}
+        return await self._request(
+            "POST", f"{SHEETS_API}/{spreadsheet_id}/values:batchUpdate", spreadsheet_id,
+            json={
+                "valueInputOption": "RAW",
+                "data": [{"range": r, "values": v} for r, v in data]
+            }
+        )
+
+    async def values_append(self, spreadsheet_id, range_, values):
+        payload = await self._request(
+            "POST", f"{SHEETS_API}/{spreadsheet_id}/values/{quote(range_, safe='')}:append", spreadsheet_id,
+            params={"valueInputOption": "RAW", "insertDataOption": "INSERT_ROWS"},
+            json={"values": values}
+        )
+        return payload.get("updates", {})
+
+
+class Spreadsheet:
+    """Таблица факультета с закэшированным списком листов"""
+
+    __slots__ = ("faculty_id", "url", "spreadsheet_id", "worksheets")
+
+    def __init__(self, faculty_id, url, worksheets):
+        self.faculty_id = faculty_id
+        self.url = url
+        self.spreadsheet_id = spreadsheet_id_from_url(url)
+        self.worksheets = worksheets
+
+    def worksheet(self, title):
+        return next((ws for ws in self.worksheets if ws["title"] == title), None)
+
+    def titles(self):
+        return [ws["title"] for ws in self.worksheets]
+
+
+class SpreadsheetCache:
+    """TTL-кэш таблиц факультетов: id таблицы и метаданные листов по Faculty.id.
+
+    Метаданные листов запрашиваются не чаще раза в ttl секунд. Обработчики,
+    которые добавляют или удаляют листы, вызывают invalidate(faculty_id).
+    """
+
+    def __init__(self, sheets_client, ttl=300, maxsize=256):
+        self.gc = sheets_client
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, faculty_id, url):
+        book = self._cache.get(faculty_id)
+        if book is None or book.url != url:
+            book = Spreadsheet(faculty_id, url, [])
+            self.gc.quota.bind(book.spreadsheet_id, faculty_id)
+            book.worksheets = await self.gc.worksheets(book.spreadsheet_id)
+            self._cache[faculty_id] = book
+        return book
+
+    def invalidate(self, faculty_id):
+        self._cache.pop(faculty_id, None)
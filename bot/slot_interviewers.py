@@ -0,0 +1,57 @@
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from db.models import Availability, User
+
+
+class SlotInterviewersCache:
+    """Собесеры, свободные в каждом слоте факультета: {(date, time_slot): [имя, ...]}.
+
+    Карта факультета строится одним запросом с array_agg по слотам при
+    первом обращении и переиспользуется пересборкой "Записи_2" и каждой
+    записью кандидата. Загрузка и восстановление занятости вызывают
+    invalidate(faculty_id); записи старше ttl секунд перечитываются —
+    так доходят и изменения, сделанные другой репликой бота.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._maps = {}  # faculty_id -> (loaded_at, {(date, time_slot): [имя, ...]})
+        self._generation = {}
+
+    @staticmethod
+    def _query(faculty_id):
+        name = func.concat_ws(" ", User.first_name, User.last_name)
+        return (
+            select(Availability.date, Availability.time_slot, func.array_agg(aggregate_order_by(name, User.id)))
+            .join(User, User.id == Availability.user_id)
+            .where(
+                Availability.faculty_id == faculty_id,
+                Availability.is_available == True,
+                User.is_sobeser == True,
+                User.faculty_id == faculty_id
+            )
+            .group_by(Availability.date, Availability.time_slot)
+        )
+
+    async def get(self, session, faculty_id):
+        entry = self._maps.get(faculty_id)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+            return entry[1]
+        generation = self._generation.get(faculty_id, 0)
+        result = await session.execute(self._query(faculty_id))
+        slots = {(date, time_slot): list(names) for date, time_slot, names in result.all()}
+        # Пока шёл запрос, занятость могли перезалить — такую карту не сохраняем
+        if self._generation.get(faculty_id, 0) == generation:
+            self._maps[faculty_id] = (time.monotonic(), slots)
+        return slots
+
+    async def names(self, session, faculty_id, date, time_slot):
+        """Имена собесеров, которые могут в слоте; пустой список, если таких нет"""
+        return (await self.get(session, faculty_id)).get((date, time_slot), [])
+
+    def invalidate(self, faculty_id):
+        self._maps.pop(faculty_id, None)
+        self._generation[faculty_id] = self._generation.get(faculty_id, 0) + 1
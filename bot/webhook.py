@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import signal
+
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука: отвечает Telegram сразу, апдейты обрабатывает в фоне.
+
+    Одновременно обрабатывается не больше concurrency апдейтов, остальные
+    ждут на семафоре. drain() дожидается обработки всего, что уже принято.
+    """
+
+    def __init__(self, dispatcher, bot, concurrency=32, **kwargs):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._in_flight = set()
+
+    async def _background_feed_update(self, bot, update):
+        task = asyncio.current_task()
+        self._in_flight.add(task)
+        try:
+            async with self._semaphore:
+                await super()._background_feed_update(bot, update)
+        finally:
+            self._in_flight.discard(task)
+
+    async def drain(self, timeout=30):
+        if not self._in_flight:
+            return
+        logging.info(f"[WEBHOOK] Дожидаемся обработки {len(self._in_flight)} апдейтов")
+        _, pending = await asyncio.wait(set(self._in_flight), timeout=timeout)
+        if pending:
+            logging.warning(f"[WEBHOOK] Не дождались {len(pending)} апдейтов за {timeout} с")
+
+
+def create_webhook_app(dispatcher, bot, path="/webhook", secret_token=None, concurrency=32, drain_timeout=30):
+    """aiohttp-приложение вебхука: (app, handler); при остановке принятые апдейты дообрабатываются"""
+    app = web.Application()
+    handler = BoundedRequestHandler(dispatcher, bot, concurrency=concurrency, secret_token=secret_token)
+
+    async def on_shutdown(app):
+        await handler.drain(drain_timeout)
+
+    # Дренаж регистрируется раньше закрытия сессии бота в handler.register
+    app.on_shutdown.append(on_shutdown)
+    handler.register(app, path=path)
+    setup_application(app, dispatcher, bot=bot)
+    return app, handler
+
+
+async def run_webhook(dispatcher, bot, base_url, path="/webhook", host="0.0.0.0", port=8080,
+                      secret_token=None, concurrency=32, drain_timeout=30):
+    """Поднимает aiohttp-сервер вебхука и работает до SIGINT/SIGTERM"""
+    app, _ = create_webhook_app(dispatcher, bot, path, secret_token, concurrency, drain_timeout)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    await bot.set_webhook(
+        base_url.rstrip("/") + path,
+        secret_token=secret_token,
+        max_connections=concurrency,
+        allowed_updates=dispatcher.resolve_used_update_types()
+    )
+    logging.info(f"[WEBHOOK] Слушаем {host}:{port}{path}, параллельно до {concurrency} апдейтов")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        # Новые запросы больше не принимаются, принятые дообрабатываются
+        await runner.cleanup()
@@ -0,0 +1,156 @@
+import datetime
+import hashlib
+
+from sqlalchemy import select, delete, literal, true, text, table, column, Integer, String
+from sqlalchemy.dialects.postgresql import insert
+
+from db.models import Availability, AvailabilitySheetHash, User
+
+# С какого числа новых строк вставка идёт через COPY, а не executemany
+COPY_THRESHOLD = 1000
+
+# Временная таблица для COPY; живёт до конца транзакции
+availability_stage = table(
+    "availability_stage",
+    column("user_id", Integer),
+    column("date", String),
+    column("time_slot", String),
+)
+
+
+async def _stage(session, cells):
+    """Заливает [(user_id, date, time_slot), ...] во временную таблицу через COPY"""
+    await session.execute(text(
+        "CREATE TEMP TABLE availability_stage ("
+        "user_id integer NOT NULL, date varchar(20) NOT NULL, time_slot varchar(20) NOT NULL"
+        ") ON COMMIT DROP"
+    ))
+    conn = await session.connection()
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "availability_stage",
+        records=cells,
+        columns=["user_id", "date", "time_slot"]
+    )
+
+
+def _insert_missing_from_stage(faculty_id):
+    s = availability_stage
+    source = (
+        select(s.c.user_id, literal(faculty_id), s.c.date, s.c.time_slot, true())
+        .distinct()
+        # Листы с ID несуществующего пользователя пропускаем, а не валим всю загрузку
+        .join(User, User.id == s.c.user_id)
+    )
+    return (
+        insert(Availability)
+        .from_select(["user_id", "faculty_id", "date", "time_slot", "is_available"], source)
+        .on_conflict_do_nothing(constraint="uq_availability_faculty_user_slot")
+        .returning(Availability.id)
+    )
+
+
+def grid_hash(cells):
+    """Хэш набора ячеек 'могу' листа; не зависит от порядка и повторов"""
+    payload = "\n".join(f"{date}|{time_slot}" for date, time_slot in sorted(set(cells)))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def forget_sheet_hashes(session, faculty_id, user_ids=None):
+    """Сбрасывает сохранённые хэши листов — следующая синхронизация сверит их с БД заново"""
+    stmt = delete(AvailabilitySheetHash).where(AvailabilitySheetHash.faculty_id == faculty_id)
+    if user_ids is not None:
+        stmt = stmt.where(AvailabilitySheetHash.user_id.in_(list(user_ids)))
+    await session.execute(stmt)
+
+
+async def sync_faculty_availability(session, faculty_id, sheets):
+    """Приводит занятость факультета к содержимому листов, меняя только разницу.
+
+    sheets — {user_id: [(date, time_slot), ...]} по всем листам собесеров.
+    Лист, хэш которого совпадает с сохранённым, пропускается без единой
+    записи в БД. Для изменившихся листов текущие строки сравниваются с
+    ячейками как множества: вставляются только новые, удаляются только
+    пропавшие (и дубли). Занятость собесеров, чьих листов больше нет,
+    удаляется. Обычная разница после правки нескольких листов вставляется
+    executemany; от COPY_THRESHOLD строк (первая загрузка, сброс хэшей)
+    — через COPY во временную таблицу, как в append_availability.
+    Коммит — за вызывающим.
+
+    Возвращает (inserted, deleted, changed, unchanged).
+    """
+    result = await session.execute(
+        select(AvailabilitySheetHash.user_id, AvailabilitySheetHash.content_hash)
+        .where(AvailabilitySheetHash.faculty_id == faculty_id)
+    )
+    stored = dict(result.all())
+    hashes = {user_id: grid_hash(cells) for user_id, cells in sheets.items()}
+    changed = {user_id for user_id, h in hashes.items() if stored.get(user_id) != h}
+
+    # Собесеры со строками в availability, но без листа (лист удалён или сменился ID)
+    result = await session.execute(
+        select(Availability.user_id).where(Availability.faculty_id == faculty_id).distinct()
+    )
+    gone = (set(result.scalars().all()) | set(stored)) - set(sheets)
+
+    touched = changed | gone
+    if not touched:
+        return 0, 0, 0, len(sheets)
+
+    result = await session.execute(
+        select(User.id).where(User.id.in_(list(changed)))
+    )
+    known = set(result.scalars().all())
+
+    result = await session.execute(
+        select(Availability.id, Availability.user_id, Availability.date, Availability.time_slot)
+        .where(Availability.faculty_id == faculty_id, Availability.user_id.in_(list(touched)))
+    )
+    have = {}
+    to_delete = []
+    for row_id, user_id, date, time_slot in result.all():
+        key = (user_id, date, time_slot)
+        if key in have:
+            to_delete.append(row_id)
+        else:
+            have[key] = row_id
+    want = {(user_id, date, time_slot) for user_id in changed & known for date, time_slot in sheets[user_id]}
+
+    to_delete.extend(row_id for key, row_id in have.items() if key not in want)
+    to_insert = sorted(want - have.keys())
+    if to_delete:
+        await session.execute(delete(Availability).where(Availability.id.in_(to_delete)))
+    if len(to_insert) >= COPY_THRESHOLD:
+        await _stage(session, to_insert)
+        await session.execute(_insert_missing_from_stage(faculty_id))
+    elif to_insert:
+        await session.execute(
+            insert(Availability).on_conflict_do_nothing(constraint="uq_availability_faculty_user_slot"),
+            [
+                {"user_id": user_id, "faculty_id": faculty_id, "date": date, "time_slot": time_slot, "is_available": True}
+                for user_id, date, time_slot in to_insert
+            ]
+        )
+
+    if gone:
+        await forget_sheet_hashes(session, faculty_id, gone)
+    if changed & known:
+        now = datetime.datetime.utcnow()
+        stmt = insert(AvailabilitySheetHash).values([
+            {"faculty_id": faculty_id, "user_id": user_id, "content_hash": hashes[user_id], "synced_at": now}
+            for user_id in changed & known
+        ])
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=["faculty_id", "user_id"],
+            set_={"content_hash": stmt.excluded.content_hash, "synced_at": stmt.excluded.synced_at}
+        ))
+    return len(to_insert), len(to_delete), len(changed), len(sheets) - len(changed)
+
+
+async def append_availability(session, faculty_id, cells):
+    """Добавляет недостающие ячейки занятости факультета; возвращает число вставленных строк"""
+    await _stage(session, cells)
+    inserted = len((await session.execute(_insert_missing_from_stage(faculty_id))).all())
+    # Строки добавлены в обход листов — их хэши больше не отражают содержимое БД
+    await forget_sheet_hashes(session, faculty_id, {user_id for user_id, _, _ in cells})
+    return inserted
@@ -0,0 +1,130 @@
+from sqlalchemy import select, update, literal, literal_column, false, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+
+from db.models import SlotLimit, InterviewRegistration, FacultyTimeDelta
+
+# Имя частичного уникального индекса: одна активная запись на пользователя
+ACTIVE_REGISTRATION_INDEX = "uq_interview_registrations_user_active"
+
+# За сколько часов до начала слот закрывается, если у факультета нет своей настройки
+DEFAULT_HOURS_BEFORE_INTERVIEW = 4
+
+
+class AlreadyRegistered(Exception):
+    """У пользователя уже есть активная запись на собеседование"""
+
+
+class SlotClosed(Exception):
+    """До начала слота осталось меньше часов, чем позволяет факультет"""
+
+
+def _before_cutoff(hours):
+    """Условие: слот начинается позже, чем через hours часов"""
+    return SlotLimit.slot_start > func.localtimestamp() + hours * literal_column("interval '1 hour'")
+
+
+def _hours_before_interview(faculty_id):
+    return func.coalesce(
+        select(FacultyTimeDelta.hours_before_interview)
+        .where(FacultyTimeDelta.faculty_id == faculty_id)
+        .scalar_subquery(),
+        DEFAULT_HOURS_BEFORE_INTERVIEW
+    )
+
+
+def bookable_slots(faculty_id, date=None):
+    """Запрос (date, time_slot) слотов факультета, на которые ещё можно записаться.
+
+    Отсечка считается в Postgres по slot_start и hours_before_interview
+    факультета из faculty_time_deltas — одно правило для всех меню.
+    Слоты упорядочены по времени начала; date сужает выборку до одного дня.
+    """
+    hours = func.coalesce(FacultyTimeDelta.hours_before_interview, DEFAULT_HOURS_BEFORE_INTERVIEW)
+    stmt = (
+        select(SlotLimit.date, SlotLimit.time_slot)
+        .outerjoin(FacultyTimeDelta, FacultyTimeDelta.faculty_id == SlotLimit.faculty_id)
+        .where(
+            SlotLimit.faculty_id == faculty_id,
+            _before_cutoff(hours)
+        )
+        .order_by(SlotLimit.slot_start, SlotLimit.id)
+    )
+    if date is not None:
+        stmt = stmt.where(SlotLimit.date == date)
+    return stmt
+
+
+async def book_seat(session, user_id, faculty_id, date, time_slot):
+    """Атомарно занимает место в слоте и создаёт запись одним запросом.
+
+    Уменьшение лимита (только если он > 0) и вставка записи выполняются
+    одним INSERT ... SELECT из data-modifying CTE, поэтому два кандидата
+    не могут занять последнее место одновременно. Отсечка та же, что в
+    bookable_slots: слот, до которого осталось меньше hours_before_interview
+    часов, не бронируется, даже если меню было открыто раньше — тогда
+    выбрасывается SlotClosed. Возвращает id записи или None, если мест нет.
+    Если у пользователя уже есть активная запись, частичный уникальный индекс
+    откатывает весь запрос вместе с уменьшением лимита и выбрасывается
+    AlreadyRegistered.
+    """
+    seat = (
+        update(SlotLimit)
+        .where(
+            SlotLimit.faculty_id == faculty_id,
+            SlotLimit.date == date,
+            SlotLimit.time_slot == time_slot,
+            SlotLimit.limit > 0,
+            _before_cutoff(_hours_before_interview(faculty_id))
+        )
+        .values(limit=SlotLimit.limit - 1)
+        .returning(SlotLimit.faculty_id, SlotLimit.date, SlotLimit.time_slot)
+        .cte("seat")
+    )
+    stmt = (
+        insert(InterviewRegistration)
+        .add_cte(seat)
+        .from_select(
+            ["user_id", "faculty_id", "date", "time_slot", "canceled", "created_at"],
+            # created_at задаётся явно: питоновский default в from_select через ORM уходит как NULL
+            select(
+                literal(user_id), seat.c.faculty_id, seat.c.date, seat.c.time_slot, false(),
+                func.timezone("utc", func.now())
+            )
+        )
+        .returning(InterviewRegistration.id)
+    )
+    try:
+        reg_id = await session.scalar(stmt)
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        if ACTIVE_REGISTRATION_INDEX in str(e.orig):
+            raise AlreadyRegistered() from e
+        raise
+    if reg_id is None:
+        # Отказ по отсечке отличаем от нехватки мест только на этом редком пути
+        still_open = await session.scalar(
+            select(SlotLimit.id).where(
+                SlotLimit.faculty_id == faculty_id,
+                SlotLimit.date == date,
+                SlotLimit.time_slot == time_slot,
+                _before_cutoff(_hours_before_interview(faculty_id))
+            )
+        )
+        if still_open is None:
+            raise SlotClosed()
+    return reg_id
+
+
+async def release_seat(session, faculty_id, date, time_slot):
+    """Возвращает место в слот без чтения текущего значения лимита"""
+    await session.execute(
+        update(SlotLimit)
+        .where(
+            SlotLimit.faculty_id == faculty_id,
+            SlotLimit.date == date,
+            SlotLimit.time_slot == time_slot
+        )
+        .values(limit=SlotLimit.limit + 1)
+    )
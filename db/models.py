@@ -1,10 +1,31 @@
 
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, Boolean, ForeignKey, Text
+from sqlalchemy import String, Integer, Boolean, ForeignKey, Text, Index, UniqueConstraint, FetchedValue, text
 # Модель для хранения временных слотов
 from sqlalchemy import Date, Time, DateTime
 import datetime
 
+class SlotStartMixin:
+    """Типизированное начало слота рядом со строковыми date/time_slot.
+
+    Колонки заполняет триггер fill_slot_start (год — текущий), поэтому они
+    помечены FetchedValue, а eager_defaults забирает их через RETURNING —
+    без ленивой догрузки в async-сессии.
+    """
+
+    slot_date: Mapped[datetime.date | None] = mapped_column(
+        Date, nullable=True, server_default=FetchedValue(), server_onupdate=FetchedValue()
+    )
+    start_time: Mapped[datetime.time | None] = mapped_column(
+        Time, nullable=True, server_default=FetchedValue(), server_onupdate=FetchedValue()
+    )
+    slot_start: Mapped[datetime.datetime | None] = mapped_column(
+        DateTime, nullable=True, server_default=FetchedValue(), server_onupdate=FetchedValue()
+    )
+
+    __mapper_args__ = {"eager_defaults": True}
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -34,6 +55,15 @@ class Faculty(Base):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Список собесеров факультета
+        Index(
+            "ix_users_faculty_sobeser",
+            "faculty_id",
+            postgresql_include=["first_name", "last_name"],
+            postgresql_where=text("is_sobeser")
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     first_name: Mapped[str] = mapped_column(String(100), nullable=True)
@@ -53,8 +83,21 @@ class Slot(Base):
     end_time: Mapped[Time] = mapped_column(Time, nullable=False)
 
 # Таблица доступности собеседующих по временным слотам
-class Availability(Base):
+class Availability(SlotStartMixin, Base):
     __tablename__ = "availability"
+    __table_args__ = (
+        # Кто свободен в слоте — меню кандидата и выпадающие списки записей
+        Index(
+            "ix_availability_faculty_slot_available",
+            "faculty_id", "date", "time_slot",
+            postgresql_include=["user_id"],
+            postgresql_where=text("is_available")
+        ),
+        Index("ix_availability_faculty_slot_start", "faculty_id", "slot_start"),
+        # Одна ячейка листа — одна строка; загрузка пишет через ON CONFLICT DO NOTHING.
+        # Префикс (faculty_id, user_id) обслуживает и сверку с листами собесеров
+        UniqueConstraint("faculty_id", "user_id", "date", "time_slot", name="uq_availability_faculty_user_slot"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
@@ -65,8 +108,11 @@ class Availability(Base):
     is_available: Mapped[bool] = mapped_column(Boolean, default=True)
 
 # Таблица лимитов слотов на дату и время
-class SlotLimit(Base):
+class SlotLimit(SlotStartMixin, Base):
     __tablename__ = "slot_limits"
+    __table_args__ = (
+        Index("ix_slot_limits_faculty_slot_start", "faculty_id", "slot_start"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     faculty_id: Mapped[int] = mapped_column(ForeignKey("faculties.id"), nullable=False)
@@ -76,8 +122,30 @@ class SlotLimit(Base):
 
     
 
-class InterviewRegistration(Base):
+class InterviewRegistration(SlotStartMixin, Base):
     __tablename__ = "interview_registrations"
+    __table_args__ = (
+        # Не больше одной активной записи на пользователя
+        Index(
+            "uq_interview_registrations_user_active",
+            "user_id",
+            unique=True,
+            postgresql_where=text("NOT canceled")
+        ),
+        # Активные записи факультета по слотам — админка и статистика
+        Index(
+            "ix_interview_registrations_faculty_slot_active",
+            "faculty_id", "date", "time_slot",
+            postgresql_where=text("NOT canceled")
+        ),
+        Index("ix_interview_registrations_faculty_slot_start", "faculty_id", "slot_start"),
+        # Очередь напоминаний: только активные записи, о которых ещё не напомнили
+        Index(
+            "ix_interview_registrations_reminder_due",
+            "slot_start",
+            postgresql_where=text("reminded_at IS NULL AND NOT canceled")
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
@@ -86,10 +154,24 @@ class InterviewRegistration(Base):
     time_slot: Mapped[str] = mapped_column(String(20), nullable=False)
     created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.utcnow)
     canceled: Mapped[bool] = mapped_column(Boolean, default=False)
+    reminded_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
 
 class FacultyTimeDelta(Base):
     __tablename__ = "faculty_time_deltas"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     faculty_id: Mapped[int] = mapped_column(ForeignKey("faculties.id"), nullable=False, unique=True)
-    hours_before_interview: Mapped[int] = mapped_column(Integer, nullable=False, default=4)
\ No newline at end of file
+    hours_before_interview: Mapped[int] = mapped_column(Integer, nullable=False, default=4)
+
+# Хэш содержимого листа доступности собесера на момент последней синхронизации
+class AvailabilitySheetHash(Base):
+    __tablename__ = "availability_sheet_hashes"
+    __table_args__ = (
+        UniqueConstraint("faculty_id", "user_id", name="uq_availability_sheet_hashes_faculty_user"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    faculty_id: Mapped[int] = mapped_column(ForeignKey("faculties.id"), nullable=False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    synced_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.utcnow)
@@ -0,0 +1,44 @@
+from sqlalchemy import select, update, func, literal_column
+
+from db.models import InterviewRegistration, User
+
+
+async def claim_due_reminders(session, hours_before, limit=100):
+    """Помечает и возвращает записи, о которых пора напомнить.
+
+    Берутся активные записи без reminded_at, до начала которых осталось
+    не больше hours_before часов, — по частичному индексу очереди, без
+    скана таблицы. reminded_at ставится тем же UPDATE до отправки, а
+    SKIP LOCKED не даёт двум репликам взять одну запись, поэтому после
+    рестарта напоминание повторно не уйдёт (но и неотправленное до
+    падения не вернётся — вызывающий берёт пачки малыми порциями и
+    дожидается их доставки). Коммит — за вызывающим.
+
+    Возвращает [(tg_id, date, time_slot), ...].
+    """
+    now = func.localtimestamp()
+    due_ids = (
+        select(InterviewRegistration.id)
+        .where(
+            InterviewRegistration.reminded_at.is_(None),
+            InterviewRegistration.canceled == False,
+            InterviewRegistration.slot_start > now,
+            InterviewRegistration.slot_start <= now + hours_before * literal_column("interval '1 hour'")
+        )
+        .order_by(InterviewRegistration.slot_start)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    claimed = (
+        update(InterviewRegistration)
+        .where(InterviewRegistration.id.in_(due_ids.scalar_subquery()))
+        .values(reminded_at=now)
+        .returning(InterviewRegistration.user_id, InterviewRegistration.date, InterviewRegistration.time_slot)
+        .cte("claimed")
+    )
+    result = await session.execute(
+        select(User.tg_id, claimed.c.date, claimed.c.time_slot)
+        .join(User, User.id == claimed.c.user_id)
+        .where(User.tg_id.is_not(None))
+    )
+    return result.all()
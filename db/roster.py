@@ -0,0 +1,74 @@
+from sqlalchemy import select, exists, literal, true, values, column, String
+from sqlalchemy.dialects.postgresql import insert
+
+from db.models import Candidate, User
+
+# Строк на один INSERT: держимся далеко от лимита asyncpg в 32767 параметров
+ROSTER_CHUNK = 1000
+
+
+def _chunks(rows):
+    for i in range(0, len(rows), ROSTER_CHUNK):
+        yield rows[i:i + ROSTER_CHUNK]
+
+
+async def upsert_candidates(session, faculty_id, rows):
+    """Вставляет или обновляет кандидатов по vk_id многострочными INSERT.
+
+    rows — [(first_name, last_name, vk_id), ...]. Уже известным кандидатам
+    обновляются имя и фамилия, только если они изменились. Возвращает
+    число вставленных или изменённых строк. Коммит — за вызывающим.
+    """
+    # Один vk_id дважды в одном INSERT ... ON CONFLICT недопустим — последний побеждает
+    by_vk = {vk_id: (first_name, last_name) for first_name, last_name, vk_id in rows}
+    payload = [
+        {"first_name": first_name, "last_name": last_name, "vk_id": vk_id, "faculty_id": faculty_id}
+        for vk_id, (first_name, last_name) in by_vk.items()
+    ]
+    touched = 0
+    for chunk in _chunks(payload):
+        stmt = insert(Candidate).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Candidate.vk_id],
+            set_={"first_name": stmt.excluded.first_name, "last_name": stmt.excluded.last_name},
+            where=(Candidate.first_name != stmt.excluded.first_name)
+            | (Candidate.last_name != stmt.excluded.last_name)
+        ).returning(Candidate.id)
+        result = await session.execute(stmt)
+        touched += len(result.all())
+    return touched
+
+
+async def insert_missing_interviewers(session, faculty_id, names):
+    """Добавляет собесеров факультета, которых ещё нет в users.
+
+    names — [(first_name, last_name), ...]; естественный ключ собесера —
+    (faculty_id, first_name, last_name). Повторный импорт того же списка
+    ничего не вставляет. Возвращает множество добавленных (first_name, last_name).
+    """
+    names = list(dict.fromkeys(names))
+    existing = User.__table__.alias("existing")
+    added = set()
+    for chunk in _chunks(names):
+        roster = values(
+            column("first_name", String), column("last_name", String), name="roster"
+        ).data(chunk)
+        source = (
+            select(roster.c.first_name, roster.c.last_name, true(), literal(faculty_id))
+            .where(~exists(
+                select(existing.c.id).where(
+                    existing.c.faculty_id == faculty_id,
+                    existing.c.is_sobeser == true(),
+                    existing.c.first_name == roster.c.first_name,
+                    existing.c.last_name == roster.c.last_name
+                )
+            ))
+        )
+        stmt = (
+            insert(User)
+            .from_select(["first_name", "last_name", "is_sobeser", "faculty_id"], source)
+            .returning(User.first_name, User.last_name)
+        )
+        result = await session.execute(stmt)
+        added.update(tuple(r) for r in result.all())
+    return added
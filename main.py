@@ -1,69 +1,150 @@
 
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.state import State, StatesGroup
 import os
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, types
 from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 from aiogram import F
 import asyncio
+import logging
 from db.engine import get_session
 from db.models import User, Faculty, Candidate, Availability, SlotLimit, InterviewRegistration, FacultyTimeDelta
+from db.booking import book_seat, release_seat, bookable_slots, AlreadyRegistered, SlotClosed
+from db.availability import sync_faculty_availability, append_availability
+from db.roster import upsert_candidates, insert_missing_interviewers
 from sqlalchemy import select, func
 from sqlalchemy.dialects.postgresql import insert
 from dotenv import load_dotenv
-import gspread
 import traceback
 import redis.asyncio as redis
+from bot.seats import SeatCounters
+from bot.media import MediaCache
+from bot.sheets import SheetsClient, SpreadsheetCache, spreadsheet_id_from_url, a1, pad_grid, data_validation_request
+from bot.sheet_sync import BookingSheetSync, BookingRow
+from bot.slot_interviewers import SlotInterviewersCache
+from bot.availability import fetch_availability_grids, parse_availability_grid
+from bot.identity import IdentityCache, IdentityMiddleware
+from bot.admin import AdminResolver, FacultyAdmin
+from bot.faculty_config import FacultyConfigCache
+from bot.webhook import run_webhook
+from bot.outbox import Outbox
+from bot.reminders import ReminderScheduler
+from bot.quota import SheetsCommandMiddleware
+from bot.fsm import create_dispatcher, VKAuth, InterviewFSM, CancelFSM
 import datetime
 
 load_dotenv()
 
 TOKEN = os.getenv("BOT_TOKEN")
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+# memory — состояние FSM живёт в процессе; redis — переживает рестарт и делится между репликами
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+# Через сколько секунд брошенный сценарий (выбор слота, причина отмены) истекает
+FSM_TTL = int(os.getenv("FSM_TTL", 24 * 3600))
+# polling — один long-poll цикл; webhook — aiohttp-сервер, апдейты можно раздавать нескольким репликам
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # внешний адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", 32))
+# Сколько таблиц факультетов диагностика читает одновременно
+STATS_CONCURRENCY = int(os.getenv("STATS_CONCURRENCY", 8))
+# За сколько часов до собеседования кандидату приходит напоминание; 0 — не напоминать
+REMINDER_HOURS = int(os.getenv("REMINDER_HOURS", 24))
+
+
 bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher()
+dp = create_dispatcher(
+    FSM_STORAGE, redis.from_url(REDIS_URL) if FSM_STORAGE == "redis" else None, FSM_TTL
+)
+# Все рассылки и уведомления идут через очередь с лимитами Telegram
+outbox = Outbox(bot)
+reminders = ReminderScheduler(outbox, hours_before=REMINDER_HOURS)
+# Отправитель апдейта резолвится один раз и приходит в обработчики как identity
+identities = IdentityCache()
+dp.update.outer_middleware(IdentityMiddleware(identities))
+# Вызовы Google Sheets учитываются по командам, из которых они сделаны
+dp.update.outer_middleware(SheetsCommandMiddleware())
+# Админские обработчики получают admin и faculty из кэша, не-админам фильтр отвечает сам
+admins = AdminResolver()
+is_faculty_admin = FacultyAdmin(admins)
+# Время блокировки, tg_id админа и ссылка на таблицу по факультетам
+faculty_configs = FacultyConfigCache()
+# Кто свободен в каждом слоте факультета — для "Записи_2" и уведомлений о записи
+slot_interviewers = SlotInterviewersCache()
 
 redis_client = None
+seat_counters = None
+media_cache = None
+sheets_client = None
+spreadsheets = None
+booking_sheet_sync = None
 
 async def get_redis():
     global redis_client
     if redis_client is None:
-        redis_client = redis.from_url("redis://redis:6379", encoding="utf-8", decode_responses=True)
+        redis_client = redis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
     return redis_client
 
-async def get_faculty_time_delta(session, faculty_id):
-    """Получает время блокировки слотов для факультета"""
-    result = await session.execute(
-        select(FacultyTimeDelta.hours_before_interview).where(
-            FacultyTimeDelta.faculty_id == faculty_id
+async def get_seat_counters():
+    global seat_counters
+    if seat_counters is None:
+        seat_counters = SeatCounters(await get_redis())
+    return seat_counters
+
+async def get_media_cache():
+    global media_cache
+    if media_cache is None:
+        media_cache = MediaCache(await get_redis())
+    return media_cache
+
+async def get_sheets_client():
+    global sheets_client
+    if sheets_client is None:
+        sheets_client = SheetsClient("credentials.json")
+    return sheets_client
+
+async def get_spreadsheets():
+    global spreadsheets
+    if spreadsheets is None:
+        spreadsheets = SpreadsheetCache(await get_sheets_client(), ttl=300)
+    return spreadsheets
+
+async def get_booking_sheet_sync():
+    global booking_sheet_sync
+    if booking_sheet_sync is None:
+        booking_sheet_sync = BookingSheetSync(
+            await get_sheets_client(), await get_spreadsheets(), interval=5.0,
+            # Распределённая блокировка нужна, только когда реплик несколько (FSM в Redis)
+            redis_client=await get_redis() if FSM_STORAGE == "redis" else None
         )
-    )
-    hours = result.scalar()
-    return hours if hours is not None else 4  # По умолчанию 4 часа
-
+        booking_sheet_sync.start()
+    return booking_sheet_sync
 
-class VKAuth(StatesGroup):
-    waiting_vk_id = State()
+async def get_faculty_time_delta(session, faculty_id):
+    """Получает время блокировки слотов для факультета"""
+    return (await faculty_configs.get(session, faculty_id)).hours_before_interview
 
-class InterviewFSM(StatesGroup):
-    choosing_date = State()
-    choosing_time = State()
 
-class CancelFSM(StatesGroup):
-    waiting_reason = State()
+async def get_bookable_slots(session, faculty_id, date=None):
+    """Слоты, которые можно показать кандидату: до отсечки факультета и со свободными местами"""
+    result = await session.execute(bookable_slots(faculty_id, date))
+    # Остаток мест берём из счётчиков в Redis
+    seats = await (await get_seat_counters()).snapshot(session, faculty_id)
+    return [(d, ts) for d, ts in result.all() if seats.get((d, ts), 0) > 0]
 
 
 # --- VK ID: старт, подтверждение, отказ ---
 @dp.message(Command("start"))
-async def start_handler(message: types.Message, state: FSMContext):
-    tg_id = str(message.from_user.id)
-    async for session in get_session():
-        user = await session.scalar(select(User).where(User.tg_id == tg_id))
-        if user and (user.is_admin_faculty or user.is_sobeser):
-            await message.answer("Вы уже авторизованы как сотрудник.")
-            return
+async def start_handler(message: types.Message, state: FSMContext, identity=None):
+    user = identity
+    if user and (user.is_admin_faculty or user.is_sobeser):
+        await message.answer("Вы уже авторизованы как сотрудник.")
+        return
     await message.answer(
         "Пожалуйста, введите ваш VK ID для регистрации.\n\n"
         "<b>VK ID</b> — это числовой идентификатор вашей страницы ВКонтакте.\n"
@@ -114,6 +195,8 @@ async def vk_yes_callback(call: CallbackQuery):
             if not user.is_candidate:
                 user.is_candidate = True
                 await session.commit()
+        # Роль поменялась — следующий апдейт перечитает пользователя из базы
+        identities.invalidate(call.from_user.id)
     kb = InlineKeyboardMarkup(
         inline_keyboard=[
             [InlineKeyboardButton(text="Записаться на собеседование", callback_data="register_interview")]
@@ -132,10 +215,9 @@ async def vk_no_callback(call: CallbackQuery, state: FSMContext):
 
 # --- Меню кандидата ---
 @dp.message(Command("menu"))
-async def candidate_menu(message: types.Message):
-    tg_id = str(message.from_user.id)
+async def candidate_menu(message: types.Message, identity=None):
     async for session in get_session():
-        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+        user = identity
         if not user or not user.is_candidate:
             await message.answer("Вы не зарегистрированы как кандидат.")
             return
@@ -167,40 +249,16 @@ async def candidate_menu(message: types.Message):
 
 # --- Кнопка Записи_2_2 кандидата ---
 @dp.callback_query(F.data == "register_interview")
-async def register_interview_start_callback(callback: CallbackQuery, state: FSMContext):
-    tg_id = str(callback.from_user.id)
+async def register_interview_start_callback(callback: CallbackQuery, state: FSMContext, identity=None):
     async for session in get_session():
-        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+        user = identity
         if not user or not user.is_candidate:
             await callback.message.edit_text("Вы не зарегистрированы как кандидат.")
             return
         faculty_id = user.faculty_id
-        now = datetime.datetime.now()
-        result = await session.execute(
-            select(SlotLimit.date).where(
-                SlotLimit.faculty_id == faculty_id,
-                SlotLimit.limit > 0
-            ).distinct()
-        )
-        # Получаем время блокировки для факультета
-        hours_delta = await get_faculty_time_delta(session, faculty_id)
-        
-        # Фильтруем даты: только те, до которых больше установленного времени
-        dates = []
-        for r in result.all():
-            try:
-                slot_date = r[0]
-                if len(slot_date) >= 5 and slot_date[2] == '.':
-                    day, month = slot_date[:2], slot_date[3:5]
-                    year = str(now.year)
-                    slot_dt = datetime.datetime.strptime(f"{day}.{month}.{year}", "%d.%m.%Y")
-                else:
-                    slot_dt = datetime.datetime.fromisoformat(slot_date)
-                # Если дата сегодня или позже, и до неё больше установленного времени
-                if slot_dt.date() > now.date() or (slot_dt.date() == now.date() and (slot_dt - now) >= datetime.timedelta(hours=hours_delta)):
-                    dates.append(slot_date)
-            except Exception:
-                continue
+        # Даты, в которых остался хотя бы один слот до отсечки факультета
+        slots = await get_bookable_slots(session, faculty_id)
+        dates = list(dict.fromkeys(d for d, ts in slots))
         if not dates:
             kb = InlineKeyboardMarkup(
                 inline_keyboard=[
@@ -221,57 +279,29 @@ async def register_interview_start_callback(callback: CallbackQuery, state: FSMC
 
 # --- Обработчик кнопки 'Назад' на этапе выбора даты ---
 @dp.callback_query(InterviewFSM.choosing_date, F.data == "reg_back_to_menu")
-async def register_interview_back_to_menu(callback: CallbackQuery, state: FSMContext):
+async def register_interview_back_to_menu(callback: CallbackQuery, state: FSMContext, identity=None):
     # Просто возвращаем меню кандидата
-    tg_id = str(callback.from_user.id)
-    async for session in get_session():
-        user = await session.scalar(select(User).where(User.tg_id == tg_id))
-        if not user or not user.is_candidate:
-            await callback.message.edit_text("Вы не зарегистрированы как кандидат.")
-            return
-        kb = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="Записаться на собеседование", callback_data="register_interview")]
-            ]
-        )
-        await callback.message.edit_text("Меню кандидата:", reply_markup=kb)
-        await state.clear()
+    user = identity
+    if not user or not user.is_candidate:
+        await callback.message.edit_text("Вы не зарегистрированы как кандидат.")
+        return
+    kb = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="Записаться на собеседование", callback_data="register_interview")]
+        ]
+    )
+    await callback.message.edit_text("Меню кандидата:", reply_markup=kb)
+    await state.clear()
 
 
 @dp.callback_query(InterviewFSM.choosing_date, F.data.startswith("reg_date:"))
-async def register_interview_choose_time(callback: CallbackQuery, state: FSMContext):
+async def register_interview_choose_time(callback: CallbackQuery, state: FSMContext, identity=None):
     date = callback.data.split(":", 1)[1]
-    tg_id = str(callback.from_user.id)
     async for session in get_session():
-        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+        user = identity
         faculty_id = user.faculty_id
-        now = datetime.datetime.now()
-        # Получаем доступные интервалы времени с лимитом > 0 и фильтруем по 4 часам
-        result = await session.execute(
-            select(SlotLimit.time_slot, SlotLimit.date).where(
-                SlotLimit.faculty_id == faculty_id,
-                SlotLimit.date == date,
-                SlotLimit.limit > 0
-            )
-        )
-        time_slots = []
-        for r in result.all():
-            ts, slot_date = r
-            try:
-                if len(slot_date) >= 5 and slot_date[2] == '.':
-                    day, month = slot_date[:2], slot_date[3:5]
-                    year = str(now.year)
-                    slot_dt = datetime.datetime.strptime(f"{day}.{month}.{year}", "%d.%m.%Y")
-                else:
-                    slot_dt = datetime.datetime.fromisoformat(slot_date)
-                if '-' in ts:
-                    start_time = ts.split('-')[0].strip()
-                    slot_dt = slot_dt.replace(hour=int(start_time[:2]), minute=int(start_time[3:5]))
-                # Можно записаться, если слот сегодня и до него больше 4 часов, либо слот в будущем
-                if slot_dt.date() > now.date() or (slot_dt.date() == now.date() and (slot_dt - now) >= datetime.timedelta(hours=4)):
-                    time_slots.append(ts)
-            except Exception:
-                continue
+        # Интервалы на выбранную дату со свободными местами и до отсечки факультета
+        time_slots = [ts for d, ts in await get_bookable_slots(session, faculty_id, date)]
         # Отправляем картинку перед выбором времени
         IMAGE_PATH = "zhim.png"  # имя файла картинки в корне проекта
         try:
@@ -280,8 +310,8 @@ async def register_interview_choose_time(callback: CallbackQuery, state: FSMCont
         except Exception:
             pass
         try:
-            with open(IMAGE_PATH, "rb") as photo:
-                await callback.message.answer_photo(photo)
+            # Картинка загружается в Telegram один раз, дальше отправляется по file_id
+            await (await get_media_cache()).answer_photo(callback.message, IMAGE_PATH)
         except Exception:
             pass
         if not time_slots:
@@ -308,46 +338,37 @@ async def register_interview_choose_time(callback: CallbackQuery, state: FSMCont
 
 
 @dp.callback_query(InterviewFSM.choosing_time, F.data.startswith("reg_time:"))
-async def register_interview_confirm(callback: CallbackQuery, state: FSMContext):
+async def register_interview_confirm(callback: CallbackQuery, state: FSMContext, identity=None):
     _, date, time_slot = callback.data.split(":", 2)
-    tg_id = str(callback.from_user.id)
     async for session in get_session():
-        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+        user = identity
         faculty_id = user.faculty_id
-        # Проверяем, не записан ли уже кандидат на этот слот
-        exists = await session.scalar(
-            select(InterviewRegistration).where(
-                InterviewRegistration.user_id == user.id,
-                InterviewRegistration.date == date,
-                InterviewRegistration.time_slot == time_slot,
-                InterviewRegistration.canceled == False
-            )
-        )
-        if exists:
-            await callback.message.edit_text("Вы уже записаны на этот слот.")
+        # Сначала занимаем место в Redis: заполненный слот отсекается без запроса к базе
+        counters = await get_seat_counters()
+        if await counters.reserve(session, faculty_id, date, time_slot) is False:
+            await callback.message.edit_text("Лимит на этот слот исчерпан.")
             return
-        # Получаем лимит
-        slot_limit = await session.scalar(
-            select(SlotLimit).where(
-                SlotLimit.faculty_id == faculty_id,
-                SlotLimit.date == date,
-                SlotLimit.time_slot == time_slot
-            )
-        )
-        if not slot_limit or slot_limit.limit <= 0:
+        # Затем занимаем место и создаём запись одним атомарным запросом
+        try:
+            reg_id = await book_seat(session, user.id, faculty_id, date, time_slot)
+        except AlreadyRegistered:
+            await counters.release(faculty_id, date, time_slot)
+            await callback.message.edit_text("Вы уже записаны на собеседование.")
+            await state.clear()
+            return
+        except SlotClosed:
+            await counters.release(faculty_id, date, time_slot)
+            await callback.message.edit_text("Запись на этот слот уже закрыта — до начала осталось слишком мало времени.")
+            return
+        except Exception:
+            # Запись не создана — место в Redis возвращаем, иначе оно пропадёт до следующего прогрева
+            await counters.release(faculty_id, date, time_slot)
+            raise
+        if reg_id is None:
+            # Счётчик в Redis разошёлся с базой — подтягиваем значение из неё
+            await counters.sync(session, faculty_id, date, time_slot)
             await callback.message.edit_text("Лимит на этот слот исчерпан.")
             return
-        # Записываем кандидата
-        reg = InterviewRegistration(
-            user_id=user.id,
-            faculty_id=faculty_id,
-            date=date,
-            time_slot=time_slot
-        )
-        session.add(reg)
-        # Уменьшаем лимит
-        slot_limit.limit -= 1
-        await session.commit()
 
         # Получаем время блокировки для предупреждения
         hours_delta = await get_faculty_time_delta(session, faculty_id)
@@ -367,149 +388,67 @@ async def register_interview_confirm(callback: CallbackQuery, state: FSMContext)
         await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
         await state.clear()
 
-        # --- Асинхронная задача для Google Sheet ---
+        # --- Асинхронная задача для Google Sheet: строка уходит в пакетную запись ---
         import asyncio
         import logging
-        async def add_to_google_sheet(user_id, first_name, last_name, faculty_id, date, time_slot):
+        async def add_to_google_sheet(user_id, first_name, last_name, faculty_id, date, time_slot, avail_names):
             try:
-                import gspread
-                from gspread_formatting import DataValidationRule, BooleanCondition, set_data_validation_for_cell_range
-                gc = gspread.service_account(filename="credentials.json")
-                # Получаем факультет
+                # Ссылка на таблицу — из кэша настроек факультета
                 async for session2 in get_session():
-                    faculty = await session2.scalar(select(Faculty).where(Faculty.id == faculty_id))
-                    if not (faculty and faculty.google_sheet_url):
+                    config = await faculty_configs.get(session2, faculty_id)
+                    if not config.google_sheet_url:
                         logging.error(f"[GSHEET] Не найден факультет или ссылка на таблицу: faculty_id={faculty_id}")
                         return
-                    sh = gc.open_by_url(faculty.google_sheet_url)
-                    try:
-                        ws = sh.worksheet("Записи_2")
-                    except Exception as e:
-                        logging.warning(f"[GSHEET] Не найден лист 'Записи_2', создаём: {e}")
-                        ws = sh.add_worksheet(title="Записи_2", rows="100", cols="10")
                     # Получаем всех собесеров факультета
                     result_all_sobesers = await session2.execute(
                         select(User).where(User.is_sobeser == True, User.faculty_id == faculty_id)
                     )
                     all_sobesers = result_all_sobesers.scalars().all()
                     all_sobesers_names = [f"{s.first_name} {s.last_name}" for s in all_sobesers]
-                    # Получаем собесеров, которые могут в это время
-                    result_avail = await session2.execute(
-                        select(User).join(Availability, Availability.user_id == User.id).where(
-                            User.is_sobeser == True,
-                            User.faculty_id == faculty_id,
-                            Availability.date == date,
-                            Availability.time_slot == time_slot,
-                            Availability.is_available == True
-                        )
-                    )
-                    avail_sobesers = result_avail.scalars().all()
-                    avail_names = [f"{s.first_name} {s.last_name}" for s in avail_sobesers]
-                    # Удаляем старую запись, если есть (по id кандидата)
-                    all_rows = ws.get_all_values()
-                    id_str = str(user_id)
-                    to_delete = []
-                    for idx, row in enumerate(all_rows, 1):
-                        if row and row[0] == id_str:
-                            to_delete.append(idx)
-                    for idx in reversed(to_delete):
-                        ws.delete_rows(idx)
-                        logging.info(f"[GSHEET] Удалена старая запись: row={idx}, user_id={user_id}")
-                        await asyncio.sleep(5)
-                    # Добавляем новую строку с пустыми значениями для dropdown
-                    row = [
-                        str(user_id),
-                        f"{first_name} {last_name}",
-                        date,
-                        time_slot,
-                        "", "", "", ""
-                    ]
-                    ws.append_row(row)
-                    logging.info(f"[GSHEET] Добавлена строка: {row}")
-                    await asyncio.sleep(5)
-                    row_num = len(all_rows) - len(to_delete) + 1
-                    # Добавляем dropdown для E и F (только те, кто может)
-                    if avail_names:
-                        rule_avail = DataValidationRule(
-                            BooleanCondition('ONE_OF_LIST', avail_names),
-                            showCustomUi=True
-                        )
-                        set_data_validation_for_cell_range(ws, f"E{row_num}:F{row_num}", rule_avail)
-                        logging.info(f"[GSHEET] Добавлен dropdown для E{row_num}:F{row_num} — {avail_names}")
-                        await asyncio.sleep(5)
-                    # Для G и H — все собесеры факультета
-                    if all_sobesers_names:
-                        rule_all = DataValidationRule(
-                            BooleanCondition('ONE_OF_LIST', all_sobesers_names),
-                            showCustomUi=True
-                        )
-                        set_data_validation_for_cell_range(ws, f"G{row_num}:H{row_num}", rule_all)
-                        logging.info(f"[GSHEET] Добавлен dropdown для G{row_num}:H{row_num} — {all_sobesers_names}")
-                        await asyncio.sleep(5)
+                    # Старая строка кандидата удалится, новая допишется при ближайшем сбросе буфера
+                    (await get_booking_sheet_sync()).enqueue(faculty_id, config.google_sheet_url, BookingRow(
+                        user_id=user_id,
+                        full_name=f"{first_name} {last_name}",
+                        date=date,
+                        time_slot=time_slot,
+                        avail_names=avail_names,
+                        all_names=all_sobesers_names
+                    ))
             except Exception as e:
                 import traceback
                 tb = traceback.format_exc()
                 logging.error(f"[GSHEET] Ошибка при добавлении Записи_2: {e}\n{tb}")
+        # Собеседующие, которые могут в это время — одна карта слотов на факультет и для таблицы, и для админа
+        avail_names = await slot_interviewers.names(session, faculty_id, date, time_slot)
         # Запускаем задачу в фоне
-        asyncio.create_task(add_to_google_sheet(user.id, user.first_name, user.last_name, faculty_id, date, time_slot))
+        asyncio.create_task(add_to_google_sheet(user.id, user.first_name, user.last_name, faculty_id, date, time_slot, avail_names))
         # Уведомляем админа факультета с указанием собеседующих
-        admin = await session.scalar(select(User).where(User.id == (await session.scalar(select(Faculty.admin_id).where(Faculty.id == faculty_id)))))
-        if admin:
+        admin_tg_id = (await faculty_configs.get(session, faculty_id)).admin_tg_id
+        if admin_tg_id:
             try:
-                # Получаем собеседующих, которые могут в это время
-                result_sobesers = await session.execute(
-                    select(User).join(Availability, Availability.user_id == User.id).where(
-                        User.is_sobeser == True,
-                        User.faculty_id == faculty_id,
-                        Availability.date == date,
-                        Availability.time_slot == time_slot,
-                        Availability.is_available == True
-                    )
-                )
-                sobesers = result_sobesers.scalars().all()
-                sobesers_list = '\n'.join([f"• {s.first_name} {s.last_name}" for s in sobesers]) or "Нет доступных собеседующих"
+                sobesers_list = '\n'.join([f"• {name}" for name in avail_names]) or "Нет доступных собеседующих"
                 msg = (
                     f"Кандидат <b>{user.first_name} {user.last_name}</b> записался на собеседование:\n"
                     f"<b>Дата:</b> {date}\n<b>Время:</b> {time_slot}\n\n"
                     f"<b>Доступные собеседующие:</b>\n{sobesers_list}"
                 )
-                await bot.send_message(admin.tg_id, msg, parse_mode="HTML")
+                outbox.post(admin_tg_id, msg, parse_mode="HTML")
             except Exception:
                 pass
         # ...отбивка теперь выше, чтобы не ждать Google Sheets
 
 
 @dp.callback_query(InterviewFSM.choosing_time, F.data == "reg_back_to_dates")
-async def register_interview_back_to_dates(callback: CallbackQuery, state: FSMContext):
-    tg_id = str(callback.from_user.id)
+async def register_interview_back_to_dates(callback: CallbackQuery, state: FSMContext, identity=None):
     async for session in get_session():
-        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+        user = identity
         if not user or not user.is_candidate:
             await callback.message.edit_text("Вы не зарегистрированы как кандидат.")
             return
         faculty_id = user.faculty_id
-        now = datetime.datetime.now()
-        result = await session.execute(
-            select(SlotLimit.date).where(
-                SlotLimit.faculty_id == faculty_id,
-                SlotLimit.limit > 0
-            ).distinct()
-        )
         # Фильтруем даты по актуальности (как в выборе даты)
-        dates = []
-        for r in result.all():
-            try:
-                slot_date = r[0]
-                if len(slot_date) >= 5 and slot_date[2] == '.':
-                    day, month = slot_date[:2], slot_date[3:5]
-                    year = str(now.year)
-                    slot_dt = datetime.datetime.strptime(f"{day}.{month}.{year}", "%d.%m.%Y")
-                else:
-                    slot_dt = datetime.datetime.fromisoformat(slot_date)
-                if slot_dt.date() > now.date() or (slot_dt.date() == now.date() and (slot_dt - now) >= datetime.timedelta(hours=4)):
-                    dates.append(slot_date)
-            except Exception:
-                continue
+        slots = await get_bookable_slots(session, faculty_id)
+        dates = list(dict.fromkeys(d for d, ts in slots))
         if not dates:
             kb = InlineKeyboardMarkup(
                 inline_keyboard=[
@@ -532,41 +471,15 @@ async def register_interview_back_to_dates(callback: CallbackQuery, state: FSMCo
 
 # --- Обработчик кнопки 'Назад' на этапе подтверждения (возврат к выбору времени) ---
 @dp.callback_query(F.data.startswith("reg_back_to_times:"))
-async def register_interview_back_to_times(callback: CallbackQuery, state: FSMContext):
+async def register_interview_back_to_times(callback: CallbackQuery, state: FSMContext, identity=None):
     date = callback.data.split(":", 1)[1]
-    tg_id = str(callback.from_user.id)
     async for session in get_session():
-        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+        user = identity
         if not user or not user.is_candidate:
             await callback.message.edit_text("Вы не зарегистрированы как кандидат.")
             return
         faculty_id = user.faculty_id
-        result = await session.execute(
-            select(SlotLimit.time_slot).where(
-                SlotLimit.faculty_id == faculty_id,
-                SlotLimit.date == date,
-                SlotLimit.limit > 0
-            )
-        )
-        time_slots = []
-        now = datetime.datetime.now()
-        for r in result.all():
-            try:
-                slot_time = r[0]
-                # date уже есть в переменной date
-                if len(date) >= 5 and date[2] == '.':
-                    day, month = date[:2], date[3:5]
-                    year = str(now.year)
-                    slot_dt = datetime.datetime.strptime(f"{day}.{month}.{year}", "%d.%m.%Y")
-                else:
-                    slot_dt = datetime.datetime.fromisoformat(date)
-                if '-' in slot_time:
-                    start_time = slot_time.split('-')[0].strip()
-                    slot_dt = slot_dt.replace(hour=int(start_time[:2]), minute=int(start_time[3:5]))
-                if slot_dt.date() > now.date() or (slot_dt.date() == now.date() and (slot_dt - now) >= datetime.timedelta(hours=4)):
-                    time_slots.append(slot_time)
-            except Exception:
-                continue
+        time_slots = [ts for d, ts in await get_bookable_slots(session, faculty_id, date)]
         if not time_slots:
             await callback.message.edit_text("Нет доступных временных интервалов на эту дату.")
             return
@@ -585,10 +498,9 @@ async def register_interview_back_to_times(callback: CallbackQuery, state: FSMCo
 
 # --- Отмена Записи_2: проверка времени и система причин ---
 @dp.callback_query(F.data == "cancel_interview")
-async def cancel_interview_callback(callback: CallbackQuery, state: FSMContext):
-    tg_id = str(callback.from_user.id)
+async def cancel_interview_callback(callback: CallbackQuery, state: FSMContext, identity=None):
     async for session in get_session():
-        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+        user = identity
         if not user or not user.is_candidate:
             await callback.message.edit_text("Вы не зарегистрированы как кандидат.")
             return
@@ -605,17 +517,10 @@ async def cancel_interview_callback(callback: CallbackQuery, state: FSMContext):
         # Проверяем время до собеседования
         now = datetime.datetime.now()
         try:
-            if len(reg.date) >= 5 and reg.date[2] == '.':
-                day, month = reg.date[:2], reg.date[3:5]
-                year = str(now.year)
-                interview_dt = datetime.datetime.strptime(f"{day}.{month}.{year}", "%d.%m.%Y")
-            else:
-                interview_dt = datetime.datetime.fromisoformat(reg.date)
-            
-            # Парсим время начала собеседования
-            if '-' in reg.time_slot:
-                start_time = reg.time_slot.split('-')[0].strip()
-                interview_dt = interview_dt.replace(hour=int(start_time[:2]), minute=int(start_time[3:5]))
+            # Начало собеседования уже разобрано в базе (slot_start)
+            interview_dt = reg.slot_start
+            if interview_dt is None:
+                raise ValueError(f"Не удалось разобрать дату Записи_2: {reg.date} {reg.time_slot}")
             
             # Получаем время блокировки для факультета
             hours_delta = await get_faculty_time_delta(session, reg.faculty_id)
@@ -668,13 +573,9 @@ async def cancel_reason_handler(message: types.Message, state: FSMContext):
             return
         
         # Получаем админа факультета
-        admin = await session.scalar(
-            select(User).where(User.id == (await session.scalar(
-                select(Faculty.admin_id).where(Faculty.id == reg.faculty_id)
-            )))
-        )
+        admin_tg_id = (await faculty_configs.get(session, reg.faculty_id)).admin_tg_id
         
-        if not admin:
+        if not admin_tg_id:
             await message.answer("Администратор факультета не найден.")
             await state.clear()
             return
@@ -697,7 +598,7 @@ async def cancel_reason_handler(message: types.Message, state: FSMContext):
         )
         
         try:
-            await bot.send_message(admin.tg_id, admin_message, reply_markup=kb, parse_mode="HTML")
+            await outbox.send(admin_tg_id, admin_message, reply_markup=kb, parse_mode="HTML")
             await message.answer(
                 "✅ <b>Запрос на отмену отправлен администратору!</b>\n\n"
                 "Ожидайте решения. Вам придет уведомление о результате.",
@@ -732,21 +633,14 @@ async def admin_approve_cancel(callback: CallbackQuery):
         await session.delete(reg)
         
         # Возвращаем лимит
-        slot_limit = await session.scalar(
-            select(SlotLimit).where(
-                SlotLimit.faculty_id == reg.faculty_id,
-                SlotLimit.date == reg.date,
-                SlotLimit.time_slot == reg.time_slot
-            )
-        )
-        if slot_limit:
-            slot_limit.limit += 1
+        await release_seat(session, reg.faculty_id, reg.date, reg.time_slot)
         
         await session.commit()
+        await (await get_seat_counters()).release(reg.faculty_id, reg.date, reg.time_slot)
         
         # Уведомляем кандидата
         try:
-            await bot.send_message(
+            outbox.post(
                 user.tg_id,
                 f"✅ <b>Ваша запись отменена!</b>\n\n"
                 f"<b>Дата:</b> {reg.date}\n"
@@ -785,7 +679,7 @@ async def admin_reject_cancel(callback: CallbackQuery):
         
         # Уведомляем кандидата
         try:
-            await bot.send_message(
+            outbox.post(
                 user.tg_id,
                 f"❌ <b>Отмена Записи_2 отклонена</b>\n\n"
                 f"<b>Дата:</b> {reg.date}\n"
@@ -804,11 +698,9 @@ async def admin_reject_cancel(callback: CallbackQuery):
         )
 
 @dp.message(Command("role"))
-async def get_role(message: Message):
-	tg_id = str(message.from_user.id)
+async def get_role(message: Message, identity=None):
 	async for session in get_session():
-		result = await session.execute(select(User).where(User.tg_id == tg_id))
-		user = result.scalar_one_or_none()
+		user = identity
 		if not user:
 			await message.answer("Вы не найдены в базе данных.")
 			return
@@ -833,83 +725,61 @@ async def get_role(message: Message):
 			roles.append("Пользователь без роли")
 		await message.answer(f"Ваша роль: {', '.join(roles)}{faculty_info}")
 
-@dp.message(Command("set_people"))
-async def set_people(message: Message):
-    tg_id = str(message.from_user.id)
+@dp.message(Command("set_people"), is_faculty_admin)
+async def set_people(message: Message, admin, faculty):
     await message.answer("Начинаю загрузку данных. Это может занять несколько минут...")
     try:
         async for session in get_session():
-            # Получаем максимальный id в users
-            max_id_result = await session.execute(select(func.max(User.id)))
-            max_id = max_id_result.scalar() or 0
-            next_id = max_id + 1
-            # Проверяем, что пользователь — админ факультета
-            result_user = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-            row = result_user.first()
-            if not row:
-                await message.answer("Вы не являетесь админом факультета или не привязаны к факультету.")
-                return
-            user, faculty = row
             if not faculty.google_sheet_url:
                 await message.answer("У факультета не указана ссылка на Google-таблицу.")
                 return
-            # Авторизация gspread
-            gc = gspread.service_account(filename="credentials.json")
-            sh = gc.open_by_url(faculty.google_sheet_url)
-            # Парсим кандидатов
-            ws_candidates = sh.worksheet("Кандидаты")
-            candidates = ws_candidates.get_all_values()[1:]  # пропускаем заголовок
-            added_candidates = 0
-            for row in candidates:
-                if not row or not row[0] or not row[1] or not row[2]:
-                    break
-                first_name, last_name, vk_id = row[0], row[1], row[2]
-                stmt = insert(Candidate).values(
-                    first_name=first_name,
-                    last_name=last_name,
-                    vk_id=vk_id,
-                    faculty_id=faculty.id
-                ).on_conflict_do_nothing(index_elements=[Candidate.vk_id])
-                await session.execute(stmt)
-                added_candidates += 1
-            # Парсим опытных собесеров
-            ws_exp = sh.worksheet("Опытные собесеры")
-            exp_rows = ws_exp.get_all_values()[1:]
-            added_exp = 0
-            for row in exp_rows:
-                if not row or not row[2] or not row[3]:
-                    break
-                first_name, last_name = row[2], row[3]
-                stmt = insert(User).values(
-                    first_name=first_name,
-                    last_name=last_name,
-                    is_sobeser=True,
-                    faculty_id=faculty.id
-                )
-                await session.execute(stmt)
-                added_exp += 1
-            # Парсим не опытных собесеров
-            ws_noexp = sh.worksheet("Не опытные собесеры")
-            noexp_rows = ws_noexp.get_all_values()[1:]
-            added_noexp = 0
-            for row in noexp_rows:
-                if not row or not row[2] or not row[3]:
+            gc = await get_sheets_client()
+            sh = spreadsheet_id_from_url(faculty.google_sheet_url)
+            gc.quota.bind(sh, faculty.id)
+            # Все три листа одним запросом
+            candidates, exp_rows, noexp_rows = await gc.values_batch_get(
+                sh, [a1("Кандидаты"), a1("Опытные собесеры"), a1("Не опытные собесеры")]
+            )
+            # Кандидаты: имя, фамилия, VK ID — до первой неполной строки
+            candidate_rows = []
+            for row in pad_grid(candidates[1:], None, 3):  # пропускаем заголовок
+                if not row[0] or not row[1] or not row[2]:
                     break
-                first_name, last_name = row[2], row[3]
-                stmt = insert(User).values(
-                    first_name=first_name,
-                    last_name=last_name,
-                    is_sobeser=True,
-                    faculty_id=faculty.id
-                )
-                await session.execute(stmt)
-                added_noexp += 1
+                candidate_rows.append((row[0], row[1], row[2]))
+            # Собесеры: имя и фамилия в C и D
+            def sobeser_names(rows):
+                names = []
+                for row in pad_grid(rows[1:], None, 4):
+                    if not row[2] or not row[3]:
+                        break
+                    names.append((row[2], row[3]))
+                return names
+            exp_names = sobeser_names(exp_rows)
+            noexp_names = sobeser_names(noexp_rows)
+            # Несколько многострочных INSERT вместо запроса на строку; повторный импорт безопасен
+            added_candidates = await upsert_candidates(session, faculty.id, candidate_rows)
+            added_sobesers = await insert_missing_interviewers(session, faculty.id, exp_names + noexp_names)
+            added_exp = len(set(exp_names) & added_sobesers)
+            added_noexp = len(set(noexp_names) & added_sobesers - set(exp_names))
             await session.commit()
             await message.answer(f"Добавлено кандидатов: {added_candidates}\nОпытных собесеров: {added_exp}\nНе опытных собесеров: {added_noexp}")
     except Exception as e:
         tb = traceback.format_exc()
         await message.answer(f"Произошла ошибка при загрузке данных:\n<pre>{e}\n{tb[-1500:]}</pre>")
 
+async def fill_availability_sheet(gc, sh, worksheet, dates, times, user_id):
+    """Заполняет лист доступности: даты, интервалы, dropdown 'могу/не могу' и ID в A15"""
+    title = worksheet["title"]
+    await gc.values_batch_update(sh, [
+        (a1(title, "B1"), [dates]),
+        (a1(title, "A2"), [[t] for t in times]),
+        (a1(title, "A15"), [[str(user_id)]])
+    ])
+    # Dropdown на всю сетку B2:I13 одним запросом
+    await gc.batch_update(sh, [
+        data_validation_request(worksheet["sheetId"], 1, 1 + len(times), 1, 1 + len(dates), ["могу", "не могу"], strict=True)
+    ])
+
 @dp.message(Command("create_list"))
 async def create_list(message: Message):
     tg_id = str(message.from_user.id)
@@ -926,53 +796,24 @@ async def create_list(message: Message):
             if not faculty.google_sheet_url:
                 await message.answer("У факультета не указана ссылка на Google-таблицу.")
                 return
-            gc = gspread.service_account(filename="credentials.json")
-            sh = gc.open_by_url(faculty.google_sheet_url)
+            gc = await get_sheets_client()
+            book = await (await get_spreadsheets()).get(faculty.id, faculty.google_sheet_url)
+            sh = book.spreadsheet_id
             # Имя листа
             sheet_name = f"{user.first_name}_{user.last_name}"
-            if sheet_name in [ws.title for ws in sh.worksheets()]:
+            if sheet_name in book.titles():
                 await message.answer("Лист с таким именем уже существует!")
                 return
-            worksheet = sh.add_worksheet(title=sheet_name, rows="20", cols="10")
-            # Заполняем даты по горизонтали (B1:H1)
+            worksheet = await gc.add_worksheet(sh, sheet_name, rows=20, cols=10)
+            (await get_spreadsheets()).invalidate(faculty.id)
+            # Даты по горизонтали (B1:I1)
             dates = ["26.09(пт)", "27.09(cб)", "28.09(вск)", "29.09(пн)", "30.09(вт)", "01.10(ср)", "02.10(чт)", "03.10(пт)"]
-            worksheet.update([dates], "B1")
-            # Заполняем интервалы по вертикали (A2:A13)
+            # Интервалы по вертикали (A2:A13)
             times = [
                 "10:00 - 11:00", "11:00 - 12:00", "12:00 - 13:00", "13:00 - 14:00", "14:00 - 15:00", "15:00 - 16:00",
                 "16:00 - 17:00", "17:00 - 18:00", "18:00 - 19:00", "19:00 - 20:00", "20:00 - 21:00", "21:00 - 22:00"
             ]
-            for i, t in enumerate(times, start=2):
-                worksheet.update([[t]], f"A{i}")
-            # Добавляем dropdown в B2:H13
-            rule = {
-                "condition": {
-                    "type": "ONE_OF_LIST",
-                    "values": [
-                        {"userEnteredValue": "могу"},
-                        {"userEnteredValue": "не могу"}
-                    ]
-                },
-                "showCustomUi": True,
-                "strict": True
-            }
-            requests = []
-            for row in range(2, 14):
-                for col in range(2, 10):
-                    requests.append({
-                        "setDataValidation": {
-                            "range": {
-                                "sheetId": worksheet._properties["sheetId"],
-                                "startRowIndex": row-1,
-                                "endRowIndex": row,
-                                "startColumnIndex": col-1,
-                                "endColumnIndex": col
-                            },
-                            "rule": rule
-                        }
-                    })
-            sh.batch_update({"requests": requests})
-            worksheet.update([[str(user.id)]], "A15")
+            await fill_availability_sheet(gc, sh, worksheet, dates, times, user.id)
             await message.answer(f"Лист {sheet_name} успешно создан!")
     except Exception as e:
         import traceback
@@ -980,24 +821,17 @@ async def create_list(message: Message):
         short_tb = tb[-500:] if len(tb) > 500 else tb
         await message.answer(f"Ошибка при создании листа:\n<pre>{e}\n{short_tb}</pre>")
 
-@dp.message(Command("create_lists"))
-async def create_lists(message: Message):
-    tg_id = str(message.from_user.id)
+@dp.message(Command("create_lists"), is_faculty_admin)
+async def create_lists(message: Message, admin, faculty):
     await message.answer("Создаю листы для всех собеседующих факультета...")
     try:
         async for session in get_session():
-            # Получаем админа и факультет
-            result = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-            row = result.first()
-            if not row:
-                await message.answer("Вы не являетесь админом факультета или не привязаны к факультету.")
-                return
-            admin, faculty = row
             if not faculty.google_sheet_url:
                 await message.answer("У факультета не указана ссылка на Google-таблицу.")
                 return
-            gc = gspread.service_account(filename="credentials.json")
-            sh = gc.open_by_url(faculty.google_sheet_url)
+            gc = await get_sheets_client()
+            book = await (await get_spreadsheets()).get(faculty.id, faculty.google_sheet_url)
+            sh = book.spreadsheet_id
             # Получаем всех собеседующих этого факультета
             result_sobesers = await session.execute(select(User).where(User.is_sobeser == True, User.faculty_id == faculty.id))
             sobesers = result_sobesers.scalars().all()
@@ -1006,58 +840,20 @@ async def create_lists(message: Message):
                 "10:00 - 11:00", "11:00 - 12:00", "12:00 - 13:00", "13:00 - 14:00", "14:00 - 15:00", "15:00 - 16:00",
                 "16:00 - 17:00", "17:00 - 18:00", "18:00 - 19:00", "19:00 - 20:00", "20:00 - 21:00", "21:00 - 22:00"
             ]
-            rule = {
-                "condition": {
-                    "type": "ONE_OF_LIST",
-                    "values": [
-                        {"userEnteredValue": "могу"},
-                        {"userEnteredValue": "не могу"}
-                    ]
-                },
-                "showCustomUi": True,
-                "strict": True
-            }
             created = 0
-            existing_sheets = {ws.title for ws in sh.worksheets()}
+            existing_sheets = set(book.titles())
             for user in sobesers:
                 sheet_name = f"{user.first_name}_{user.last_name}"
                 if sheet_name in existing_sheets:
                     continue
-                retry_count = 0
-                while retry_count < 3:
-                    try:
-                        worksheet = sh.add_worksheet(title=sheet_name, rows="20", cols="10")
-                        worksheet.update([dates], "B1")
-                        for i, t in enumerate(times, start=2):
-                            worksheet.update([[t]], f"A{i}")
-                        requests = []
-                        for row in range(2, 14):
-                            for col in range(2, 10):
-                                requests.append({
-                                    "setDataValidation": {
-                                        "range": {
-                                            "sheetId": worksheet._properties["sheetId"],
-                                            "startRowIndex": row-1,
-                                            "endRowIndex": row,
-                                            "startColumnIndex": col-1,
-                                            "endColumnIndex": col
-                                        },
-                                        "rule": rule
-                                    }
-                                })
-                        sh.batch_update({"requests": requests})
-                        worksheet.update([[str(user.id)]], "A15")
-                        created += 1
-                        await asyncio.sleep(5)
-                        break
-                    except gspread.exceptions.APIError as e:
-                        if "429" in str(e):
-                            retry_count += 1
-                            await asyncio.sleep(30 * retry_count)
-                        else:
-                            break
-                    except Exception:
-                        break
+                # Темп и повторы на 429 обеспечивает регулятор квоты в SheetsClient
+                try:
+                    worksheet = await gc.add_worksheet(sh, sheet_name, rows=20, cols=10)
+                    (await get_spreadsheets()).invalidate(faculty.id)
+                    await fill_availability_sheet(gc, sh, worksheet, dates, times, user.id)
+                    created += 1
+                except Exception as e:
+                    logging.error(f"[GSHEET] Не удалось создать лист {sheet_name}: {e}")
             await message.answer(f"Создано листов: {created}")
     except Exception as e:
         import traceback
@@ -1065,83 +861,47 @@ async def create_lists(message: Message):
         short_tb = tb[-500:] if len(tb) > 500 else tb
         await message.answer(f"Ошибка при создании листов:\n<pre>{e}\n{short_tb}</pre>")
 
-@dp.message(Command("parse_availability"))
-async def parse_availability(message: Message):
-    tg_id = str(message.from_user.id)
+@dp.message(Command("parse_availability"), is_faculty_admin)
+async def parse_availability(message: Message, admin, faculty):
     await message.answer("Начинаю парсинг доступности всех собеседующих...")
     try:
         async for session in get_session():
-            # Получаем админа и факультет
-            result = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-            row = result.first()
-            if not row:
-                await message.answer("Вы не являетесь админом факультета или не привязаны к факультету.")
-                return
-            admin, faculty = row
             if not faculty.google_sheet_url:
                 await message.answer("У факультета не указана ссылка на Google-таблицу.")
                 return
-            # Удаляем старую занятость для факультета
-            await session.execute(
-                Availability.__table__.delete().where(Availability.faculty_id == faculty.id)
-            )
-            await session.commit()
-            gc = gspread.service_account(filename="credentials.json")
-            sh = gc.open_by_url(faculty.google_sheet_url)
-            exclude = {"Кандидаты", "Опытные собесеры", "Не опытные собесеры"}
-            sheets = [ws for ws in sh.worksheets() if ws.title not in exclude]
-            added = 0
-            for ws in sheets:
+            gc = await get_sheets_client()
+            book = await (await get_spreadsheets()).get(faculty.id, faculty.google_sheet_url)
+            sh = book.spreadsheet_id
+            exclude = {"Кандидаты", "Опытные собесеры", "Не опытные собесеры", "Записи_2"}
+            sheets = [title for title in book.titles() if title not in exclude]
+            # Сетки всех листов собесеров — один batchGet на пачку листов, разбор в памяти
+            grids = await fetch_availability_grids(gc, sh, sheets)
+            by_user = {}
+            for title, rows in grids.items():
                 try:
-                    user_id_cell = ws.acell("A15").value
-                    if not user_id_cell:
-                        continue
-                    user_id = int(user_id_cell)
-                    # Даты в B1:I1 (8 столбцов)
-                    date_cells = ws.range("B1:I1")
-                    date_values = [cell.value for cell in date_cells]
-                    # Временные интервалы в A2:A13 (12 строк)
-                    time_cells = ws.range("A2:A13")
-                    time_values = [cell.value for cell in time_cells]
-                    # Парсим диапазон B2:I13 (12 строк x 8 столбцов)
-                    grid = ws.range("B2:I13")
-                    for i, cell in enumerate(grid):
-                        row = i // 8  # 0..11
-                        col = i % 8   # 0..7
-                        value = cell.value.strip().lower()
-                        if value == "могу":
-                            date = date_values[col]
-                            time_slot = time_values[row]
-                            stmt = insert(Availability).values(
-                                user_id=user_id,
-                                faculty_id=faculty.id,
-                                date=date,
-                                time_slot=time_slot,
-                                is_available=True
-                            ).on_conflict_do_nothing()
-                            await session.execute(stmt)
-                            added += 1
-                except Exception:
+                    user_id, cells = parse_availability_grid(rows)
+                except ValueError:
+                    continue
+                if user_id is None:
                     continue
+                by_user.setdefault(user_id, []).extend(cells)
+            # В БД пишется только разница; неизменившиеся листы не трогаются вовсе
+            added, removed, changed, unchanged = await sync_faculty_availability(session, faculty.id, by_user)
             await session.commit()
-            await message.answer(f"Добавлено доступных слотов: {added}")
+            slot_interviewers.invalidate(faculty.id)
+            await message.answer(
+                f"Листов изменилось: {changed}, без изменений: {unchanged}\n"
+                f"Добавлено доступных слотов: {added}, удалено: {removed}"
+            )
     except Exception as e:
         import traceback
         tb = traceback.format_exc()
         short_tb = tb[-500:] if len(tb) > 500 else tb
         await message.answer(f"Ошибка при парсинге:<pre>{e}\n{short_tb}</pre>")
 
-@dp.message(Command("create_slots"))
-async def create_slots(message: Message):
-    tg_id = str(message.from_user.id)
+@dp.message(Command("create_slots"), is_faculty_admin)
+async def create_slots(message: Message, admin, faculty):
     async for session in get_session():
-        # Проверяем, что пользователь — админ факультета
-        result = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-        row = result.first()
-        if not row:
-            await message.answer("Вы не являетесь админом факультета или не привязаны к факультету.")
-            return
-        admin, faculty = row
         # Получаем все даты, где есть хотя бы один 'могу'
         result_dates = await session.execute(
             select(Availability.date).where(
@@ -1168,18 +928,10 @@ async def create_slots(message: Message):
             text += f"• {date} — <b>{limit}</b> слотов\n"
         await message.answer(text, reply_markup=kb, parse_mode="HTML")
 
-@dp.callback_query(F.data.startswith("slot_date:"))
-async def slot_date_callback(callback: CallbackQuery):
+@dp.callback_query(F.data.startswith("slot_date:"), is_faculty_admin)
+async def slot_date_callback(callback: CallbackQuery, admin, faculty):
     date = callback.data.split(":", 1)[1]
-    tg_id = str(callback.from_user.id)
     async for session in get_session():
-        # Проверяем, что пользователь — админ факультета
-        result = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-        row = result.first()
-        if not row:
-            await callback.message.edit_text("Вы не являетесь админом факультета или не привязаны к факультету.")
-            return
-        admin, faculty = row
         # Получаем все интервалы времени, где есть хотя бы один 'могу'
         result_times = await session.execute(
             select(Availability.time_slot).where(
@@ -1208,16 +960,9 @@ async def slot_date_callback(callback: CallbackQuery):
             text += f"• {time_slot} — <b>{limit}</b> слотов\n"
         await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
 
-@dp.callback_query(F.data == "create_slots")
-async def back_to_dates(callback: CallbackQuery):
-    tg_id = str(callback.from_user.id)
+@dp.callback_query(F.data == "create_slots", is_faculty_admin)
+async def back_to_dates(callback: CallbackQuery, admin, faculty):
     async for session in get_session():
-        result = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-        row = result.first()
-        if not row:
-            await callback.message.edit_text("Вы не являетесь админом факультета или не привязаны к факультету.")
-            return
-        admin, faculty = row
         # Получаем все даты, где есть хотя бы один 'могу'
         result_dates = await session.execute(
             select(Availability.date).where(
@@ -1244,18 +989,9 @@ async def back_to_dates(callback: CallbackQuery):
             text += f"• {date} — <b>{limit}</b> слотов\n"
         await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
 
-@dp.callback_query(F.data.startswith("slot_time:"))
-async def slot_time_callback(callback: CallbackQuery):
-    _, date, time_slot = callback.data.split(":", 2)
-    tg_id = str(callback.from_user.id)
+async def show_slot_menu(callback: CallbackQuery, faculty, date, time_slot):
+    """Меню слота: кто свободен, текущий лимит и кнопки изменения"""
     async for session in get_session():
-        # Проверяем, что пользователь — админ факультета
-        result = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-        row = result.first()
-        if not row:
-            await callback.message.edit_text("Вы не являетесь админом факультета или не привязаны к факультету.")
-            return
-        admin, faculty = row
         # Получаем всех пользователей, которые могут в это время и день
         result_users = await session.execute(
             select(User).join(Availability, Availability.user_id == User.id).where(
@@ -1292,6 +1028,11 @@ async def slot_time_callback(callback: CallbackQuery):
         )
         await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
 
+@dp.callback_query(F.data.startswith("slot_time:"), is_faculty_admin)
+async def slot_time_callback(callback: CallbackQuery, admin, faculty):
+    _, date, time_slot = callback.data.split(":", 2)
+    await show_slot_menu(callback, faculty, date, time_slot)
+
 # --- Добавление слотов: обработка кнопки 'Добавить' ---
 @dp.callback_query(F.data.startswith("slot_add:"))
 async def slot_add_callback(callback: CallbackQuery):
@@ -1303,14 +1044,14 @@ async def slot_add_callback(callback: CallbackQuery):
     await callback.message.edit_text(f"Сколько мест добавить к {date} {time_slot}?", reply_markup=kb)
 
 # Кнопка назад из режима добавления
-@dp.callback_query(F.data.startswith("slot_add_back:"))
-async def slot_add_back_callback(callback: CallbackQuery):
+@dp.callback_query(F.data.startswith("slot_add_back:"), is_faculty_admin)
+async def slot_add_back_callback(callback: CallbackQuery, admin, faculty):
     _, date, time_slot = callback.data.split(":", 2)
-    await slot_time_callback(callback=callback)
+    await show_slot_menu(callback, faculty, date, time_slot)
 
 # --- Обработка выбора количества для добавления ---
-@dp.callback_query(F.data.startswith("slot_add_count:"))
-async def slot_add_count_callback(callback: CallbackQuery):
+@dp.callback_query(F.data.startswith("slot_add_count:"), is_faculty_admin)
+async def slot_add_count_callback(callback: CallbackQuery, admin, faculty):
     # slot_add_count:date:time_slot|add_count
     data = callback.data[len("slot_add_count:"):]
     slot_info, add_count = data.split("|", 1)
@@ -1320,14 +1061,7 @@ async def slot_add_count_callback(callback: CallbackQuery):
     except Exception:
         await callback.message.edit_text("Ошибка: не удалось определить количество для добавления.")
         return
-    tg_id = str(callback.from_user.id)
     async for session in get_session():
-        result = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-        row = result.first()
-        if not row:
-            await callback.message.edit_text("Вы не являетесь админом факультета или не привязаны к факультету.")
-            return
-        admin, faculty = row
         slot_limit_obj = await session.scalar(
             select(SlotLimit).where(
                 SlotLimit.faculty_id == faculty.id,
@@ -1348,6 +1082,7 @@ async def slot_add_count_callback(callback: CallbackQuery):
             session.add(slot_limit_obj)
         await session.commit()
         after = slot_limit_obj.limit
+        await (await get_seat_counters()).set(faculty.id, date, time_slot, after)
         kb = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="Назад", callback_data=f"slot_time:{date}:{time_slot}")]
         ])
@@ -1367,14 +1102,14 @@ async def slot_del_callback(callback: CallbackQuery):
     await callback.message.edit_text(f"Сколько мест удалить из {date} {time_slot}?", reply_markup=kb)
 
 # Кнопка назад из режима удаления
-@dp.callback_query(F.data.startswith("slot_del_back:"))
-async def slot_del_back_callback(callback: CallbackQuery):
+@dp.callback_query(F.data.startswith("slot_del_back:"), is_faculty_admin)
+async def slot_del_back_callback(callback: CallbackQuery, admin, faculty):
     _, date, time_slot = callback.data.split(":", 2)
-    await slot_time_callback(callback=callback)
+    await show_slot_menu(callback, faculty, date, time_slot)
 
 # --- Обработка выбора количества для удаления ---
-@dp.callback_query(F.data.startswith("slot_del_count:"))
-async def slot_del_count_callback(callback: CallbackQuery):
+@dp.callback_query(F.data.startswith("slot_del_count:"), is_faculty_admin)
+async def slot_del_count_callback(callback: CallbackQuery, admin, faculty):
     # slot_del_count:date:time_slot|del_count
     data = callback.data[len("slot_del_count:"):]
     slot_info, del_count = data.split("|", 1)
@@ -1384,14 +1119,7 @@ async def slot_del_count_callback(callback: CallbackQuery):
     except Exception:
         await callback.message.edit_text("Ошибка: не удалось определить количество для удаления.")
         return
-    tg_id = str(callback.from_user.id)
     async for session in get_session():
-        result = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-        row = result.first()
-        if not row:
-            await callback.message.edit_text("Вы не являетесь админом факультета или не привязаны к факультету.")
-            return
-        admin, faculty = row
         slot_limit_obj = await session.scalar(
             select(SlotLimit).where(
                 SlotLimit.faculty_id == faculty.id,
@@ -1404,6 +1132,7 @@ async def slot_del_count_callback(callback: CallbackQuery):
             slot_limit_obj.limit = max(0, slot_limit_obj.limit - del_count)
             await session.commit()
             after = slot_limit_obj.limit
+            await (await get_seat_counters()).set(faculty.id, date, time_slot, after)
             kb = InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="Назад", callback_data=f"slot_time:{date}:{time_slot}")]
             ])
@@ -1420,21 +1149,13 @@ async def slot_del_count_callback(callback: CallbackQuery):
                 reply_markup=kb, parse_mode="HTML"
             )
 
-@dp.callback_query(F.data.startswith("slot_count:"))
-async def slot_count_callback(callback: CallbackQuery):
+@dp.callback_query(F.data.startswith("slot_count:"), is_faculty_admin)
+async def slot_count_callback(callback: CallbackQuery, admin, faculty):
     data = callback.data[len("slot_count:"):]
     rest, count = data.rsplit(":", 1)
     date, time_slot = rest.split(":", 1)
     count = int(count)
-    tg_id = str(callback.from_user.id)
     async for session in get_session():
-        # Проверяем, что пользователь — админ факультета
-        result = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-        row = result.first()
-        if not row:
-            await callback.message.edit_text("Вы не являетесь админом факультета или не привязаны к факультету.")
-            return
-        admin, faculty = row
         # Сохраняем/обновляем лимит слотов
         stmt = insert(SlotLimit).values(
             faculty_id=faculty.id,
@@ -1447,6 +1168,7 @@ async def slot_count_callback(callback: CallbackQuery):
         )
         await session.execute(stmt)
         await session.commit()
+        await (await get_seat_counters()).set(faculty.id, date, time_slot, count)
         kb = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="Назад", callback_data=f"slot_time:{date}:{time_slot}")]
         ])
@@ -1454,27 +1176,19 @@ async def slot_count_callback(callback: CallbackQuery):
 
 
 # --- Команда для админа: получить все Записи_2 кандидатов по дням ---
-@dp.message(Command("get_zapis"))
-async def get_zapis(message: types.Message):
-    tg_id = str(message.from_user.id)
+@dp.message(Command("get_zapis"), is_faculty_admin)
+async def get_zapis(message: types.Message, admin, faculty):
     async for session in get_session():
-        # Проверяем, что пользователь — админ факультета
-        result = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-        row = result.first()
-        if not row:
-            await message.answer("Вы не являетесь админом факультета или не привязаны к факультету.")
-            return
-        admin, faculty = row
         # Получаем все Записи_2 по факультету
         result_regs = await session.execute(
             select(InterviewRegistration, User)
             .join(User, User.id == InterviewRegistration.user_id)
             .where(InterviewRegistration.faculty_id == faculty.id, InterviewRegistration.canceled == False)
-            .order_by(InterviewRegistration.date, InterviewRegistration.time_slot)
+            .order_by(InterviewRegistration.slot_start, InterviewRegistration.date, InterviewRegistration.time_slot)
         )
         rows = result_regs.all()
         if not rows:
-            await message.answer("Нет записей на собеседования.")
+            outbox.post(message.chat.id, "Нет записей на собеседования.")
             return
         # Группируем по дате
         from collections import defaultdict
@@ -1482,12 +1196,23 @@ async def get_zapis(message: types.Message):
         for reg, user in rows:
             zapis_by_date[reg.date].append((reg.time_slot, user.first_name, user.last_name))
         # Формируем сообщения по дням
-        for date, zapis in sorted(zapis_by_date.items()):
+        # Словарь уже упорядочен по slot_start — "01.10" идёт после "26.09"
+        for date, zapis in zapis_by_date.items():
             zapis.sort()
             text = f"<b>{date}</b>\n"
             for time_slot, first_name, last_name in zapis:
                 text += f"<b>{time_slot}</b>: {first_name} {last_name}\n"
-            await message.answer(text, parse_mode="HTML")
+            outbox.post(message.chat.id, text, parse_mode="HTML")
+
+
+# --- Расход квоты Google Sheets по факультетам и командам ---
+@dp.message(Command("sheets_usage"))
+async def sheets_usage(message: types.Message):
+    if str(message.from_user.id) != "922109605":
+        await message.answer("У вас нет доступа к этой команде.")
+        return
+    report = (await get_sheets_client()).quota.report()
+    await message.answer(f"<b>Вызовы Google Sheets:</b>\n<pre>{report or 'пока не было'}</pre>", parse_mode="HTML")
 
 
 # --- Глобальная диагностика всех факультетов ---
@@ -1497,10 +1222,10 @@ async def get_fucking_stats(message: types.Message):
     
     # Проверяем доступ - только для конкретного пользователя
     if tg_id != "922109605":
-        await message.answer("У вас нет доступа к этой команде.")
+        outbox.post(message.chat.id, "У вас нет доступа к этой команде.")
         return
     
-    await message.answer("🔍 Начинаю глобальную диагностику всех факультетов...")
+    outbox.post(message.chat.id, "🔍 Начинаю глобальную диагностику всех факультетов...")
     
     try:
         async for session in get_session():
@@ -1509,7 +1234,7 @@ async def get_fucking_stats(message: types.Message):
             faculties = result_faculties.scalars().all()
             
             if not faculties:
-                await message.answer("❌ Факультеты не найдены в базе данных.")
+                outbox.post(message.chat.id, "❌ Факультеты не найдены в базе данных.")
                 return
             
             total_stats = {
@@ -1521,13 +1246,41 @@ async def get_fucking_stats(message: types.Message):
                 'faculty_details': []
             }
             
+            # Слоты в базе по всем факультетам — одним GROUP BY
+            result_db_slots = await session.execute(
+                select(Availability.faculty_id, func.count(Availability.id))
+                .where(Availability.is_available == True)
+                .group_by(Availability.faculty_id)
+            )
+            db_slots_by_faculty = dict(result_db_slots.all())
+            
             # Исключаемые листы
             excluded_sheets = {"Кандидаты", "Опытные собесеры", "Не опытные собесеры", "Записи_2"}
+            gc = await get_sheets_client()
+            spreadsheets_cache = await get_spreadsheets()
+            # Таблицы факультетов читаются параллельно, но не больше STATS_CONCURRENCY сразу
+            limit = asyncio.Semaphore(STATS_CONCURRENCY)
             
-            for faculty in faculties:
-                if not faculty.google_sheet_url:
-                    continue
-                    
+            async def count_sheet_slots(faculty):
+                """Листы собесеров и число отметок 'могу' в таблице факультета"""
+                async with limit:
+                    book = await spreadsheets_cache.get(faculty.id, faculty.google_sheet_url)
+                    user_sheets = [title for title in book.titles() if title not in excluded_sheets]
+                    grids = await fetch_availability_grids(gc, book.spreadsheet_id, user_sheets)
+                sheets_slots = 0
+                for rows in grids.values():
+                    try:
+                        user_id, cells = parse_availability_grid(rows)
+                    except ValueError:
+                        continue
+                    if user_id is not None:
+                        sheets_slots += len(cells)
+                return len(user_sheets), sheets_slots
+            
+            faculties = [f for f in faculties if f.google_sheet_url]
+            results = await asyncio.gather(*(count_sheet_slots(f) for f in faculties), return_exceptions=True)
+            
+            for faculty, result in zip(faculties, results):
                 faculty_stats = {
                     'faculty_name': faculty.name,
                     'faculty_id': faculty.id,
@@ -1537,84 +1290,28 @@ async def get_fucking_stats(message: types.Message):
                     'missing_slots': 0,
                     'error': None
                 }
+                if isinstance(result, Exception):
+                    faculty_stats['error'] = str(result)
+                    total_stats['faculty_details'].append(faculty_stats)
+                    continue
+                sheets_checked, sheets_slots = result
+                db_slots = db_slots_by_faculty.get(faculty.id, 0)
+                # Вычисляем потерянные слоты
+                missing_slots = max(0, sheets_slots - db_slots)
+                faculty_stats.update(
+                    sheets_checked=sheets_checked,
+                    slots_found=sheets_slots,
+                    slots_in_db=db_slots,
+                    missing_slots=missing_slots
+                )
                 
-                try:
-                    # Подключаемся к Google Sheets
-                    gc = gspread.service_account(filename="credentials.json")
-                    sh = gc.open_by_url(faculty.google_sheet_url)
-                    
-                    # Получаем все листы
-                    worksheets = sh.worksheets()
-                    faculty_stats['total_sheets'] = len(worksheets)
-                    
-                    # Фильтруем листы (исключаем служебные)
-                    user_sheets = [ws for ws in worksheets if ws.title not in excluded_sheets]
-                    faculty_stats['sheets_checked'] = len(user_sheets)
-                    
-                    # Считаем слоты в Google Sheets
-                    sheets_slots = 0
-                    for ws in user_sheets:
-                        try:
-                            # Парсим лист доступности
-                            user_id_cell = ws.acell("A15").value
-                            if not user_id_cell:
-                                continue
-                                
-                            # Даты в A1:I1 (включая A1)
-                            date_cells = ws.range("A1:I1")
-                            date_values = [cell.value for cell in date_cells if cell.value]
-                            
-                            # Временные интервалы в A2:A13 (12 строк)
-                            time_cells = ws.range("A2:A13")
-                            time_values = [cell.value for cell in time_cells if cell.value]
-                            
-                            # Парсим диапазон A2:I13 (9 столбцов x 12 строк)
-                            grid = ws.range("A2:I13")
-                            for i, cell in enumerate(grid):
-                                row = i // 9  # 0..11 (12 строк)
-                                col = i % 9   # 0..8 (9 столбцов)
-                                
-                                if row < len(time_values) and col < len(date_values):
-                                    value = cell.value.strip().lower() if cell.value else ""
-                                    if value == "могу":
-                                        sheets_slots += 1
-                            
-                            # Задержка между запросами для избежания rate limiting
-                            await asyncio.sleep(2.0)
-                            
-                        except Exception as e:
-                            continue
-                    
-                    faculty_stats['slots_found'] = sheets_slots
-                    
-                    # Считаем слоты в базе данных для этого факультета
-                    result_db_slots = await session.execute(
-                        select(func.count(Availability.id)).where(
-                            Availability.faculty_id == faculty.id,
-                            Availability.is_available == True
-                        )
-                    )
-                    db_slots = result_db_slots.scalar() or 0
-                    faculty_stats['slots_in_db'] = db_slots
-                    
-                    # Вычисляем потерянные слоты
-                    missing_slots = max(0, sheets_slots - db_slots)
-                    faculty_stats['missing_slots'] = missing_slots
-                    
-                    # Обновляем общую статистику
-                    total_stats['faculties_checked'] += 1
-                    total_stats['total_sheets_checked'] += faculty_stats['sheets_checked']
-                    total_stats['total_slots_found'] += sheets_slots
-                    total_stats['total_slots_in_db'] += db_slots
-                    total_stats['total_missing_slots'] += missing_slots
-                    
-                except Exception as e:
-                    faculty_stats['error'] = str(e)
-                
+                # Обновляем общую статистику
+                total_stats['faculties_checked'] += 1
+                total_stats['total_sheets_checked'] += sheets_checked
+                total_stats['total_slots_found'] += sheets_slots
+                total_stats['total_slots_in_db'] += db_slots
+                total_stats['total_missing_slots'] += missing_slots
                 total_stats['faculty_details'].append(faculty_stats)
-                
-                # Задержка между факультетами
-                await asyncio.sleep(5)
             
             # Формируем отчет
             report = "📊 <b>ГЛОБАЛЬНАЯ ДИАГНОСТИКА ФАКУЛЬТЕТОВ</b>\n\n"
@@ -1626,31 +1323,24 @@ async def get_fucking_stats(message: types.Message):
             report += f"💾 <b>Слотов в базе данных:</b> {total_stats['total_slots_in_db']}\n"
             report += f"❌ <b>Потерянных слотов:</b> {total_stats['total_missing_slots']}\n\n"
             
-            # Детали по факультетам
-            report += "<b>📋 ДЕТАЛИ ПО ФАКУЛЬТЕТАМ:</b>\n"
+            # Детали по факультетам: каждый факультет — отдельный блок, очередь склеит их в сообщения до 4096 символов
+            report += "<b>📋 ДЕТАЛИ ПО ФАКУЛЬТЕТАМ:</b>"
+            outbox.post(message.chat.id, report, parse_mode="HTML")
             for detail in total_stats['faculty_details']:
                 if detail['error']:
-                    report += f"\n❌ <b>{detail['faculty_name']}</b> - ОШИБКА: {detail['error']}"
+                    block = f"❌ <b>{detail['faculty_name']}</b> - ОШИБКА: {detail['error'][:1000]}"
                 else:
-                    report += f"\n🏛️ <b>{detail['faculty_name']}</b>\n"
-                    report += f"   📋 Листов: {detail['sheets_checked']}\n"
-                    report += f"   ✅ В Google Sheets: {detail['slots_found']}\n"
-                    report += f"   💾 В БД: {detail['slots_in_db']}\n"
-                    report += f"   ❌ Потеряно: {detail['missing_slots']}"
-            
-            # Отправляем отчет
-            if len(report) > 4000:
-                # Разбиваем на части если сообщение слишком длинное
-                parts = [report[i:i+4000] for i in range(0, len(report), 4000)]
-                for part in parts:
-                    await message.answer(part, parse_mode="HTML")
-            else:
-                await message.answer(report, parse_mode="HTML")
+                    block = f"🏛️ <b>{detail['faculty_name']}</b>\n"
+                    block += f"   📋 Листов: {detail['sheets_checked']}\n"
+                    block += f"   ✅ В Google Sheets: {detail['slots_found']}\n"
+                    block += f"   💾 В БД: {detail['slots_in_db']}\n"
+                    block += f"   ❌ Потеряно: {detail['missing_slots']}"
+                outbox.post(message.chat.id, block, parse_mode="HTML")
                 
     except Exception as e:
         import traceback
         tb = traceback.format_exc()
-        await message.answer(f"❌ Ошибка при диагностике:\n<pre>{e}\n{tb[-1000:]}</pre>")
+        outbox.post(message.chat.id, f"❌ Ошибка при диагностике:\n<pre>{e}\n{tb[-1000:]}</pre>")
 
 
 # --- Команда восстановления потерянных данных ---
@@ -1670,104 +1360,53 @@ async def recover_missing_data(message: types.Message):
             # Получаем все факультеты
             result_faculties = await session.execute(select(Faculty))
             faculties = result_faculties.scalars().all()
-            
-            recovered_count = 0
-            errors = []
-            
-            # Исключаемые листы
-            excluded_sheets = {"Кандидаты", "Опытные собесеры", "Не опытные собесеры", "Записи_2"}
-            
-            for faculty in faculties:
-                if not faculty.google_sheet_url:
-                    continue
-                    
-                try:
-                    # Подключаемся к Google Sheets
-                    gc = gspread.service_account(filename="credentials.json")
-                    sh = gc.open_by_url(faculty.google_sheet_url)
-                    
-                    # Получаем все листы
-                    worksheets = sh.worksheets()
-                    user_sheets = [ws for ws in worksheets if ws.title not in excluded_sheets]
-                    
-                    for ws in user_sheets:
-                        try:
-                            # Парсим лист доступности
-                            user_id_cell = ws.acell("A15").value
-                            if not user_id_cell:
-                                continue
-                                
-                            user_id = int(user_id_cell)
-                            
-                            # Даты в A1:I1 (включая A1)
-                            date_cells = ws.range("A1:I1")
-                            date_values = [cell.value for cell in date_cells if cell.value]
-                            
-                            # Временные интервалы в A2:A13 (12 строк)
-                            time_cells = ws.range("A2:A13")
-                            time_values = [cell.value for cell in time_cells if cell.value]
-                            
-                            # Парсим диапазон A2:I13 (9 столбцов x 12 строк)
-                            grid = ws.range("A2:I13")
-                            for i, cell in enumerate(grid):
-                                row = i // 9  # 0..11 (12 строк)
-                                col = i % 9   # 0..8 (9 столбцов)
-                                
-                                if row < len(time_values) and col < len(date_values):
-                                    value = cell.value.strip().lower() if cell.value else ""
-                                    if value == "могу":
-                                        date = date_values[col]
-                                        time_slot = time_values[row]
-                                        
-                                        # Проверяем, есть ли уже такая запись в БД
-                                        existing = await session.scalar(
-                                            select(Availability).where(
-                                                Availability.user_id == user_id,
-                                                Availability.faculty_id == faculty.id,
-                                                Availability.date == date,
-                                                Availability.time_slot == time_slot
-                                            )
-                                        )
-                                        
-                                        if not existing:
-                                            # Добавляем недостающую запись
-                                            new_availability = Availability(
-                                                user_id=user_id,
-                                                faculty_id=faculty.id,
-                                                date=date,
-                                                time_slot=time_slot,
-                                                is_available=True
-                                            )
-                                            session.add(new_availability)
-                                            recovered_count += 1
-                            
-                            # Задержка между запросами
-                            await asyncio.sleep(2.0)
-                            
-                        except Exception as e:
-                            continue
-                    
-                    # Задержка между факультетами
-                    await asyncio.sleep(5)
-                    
-                except Exception as e:
-                    errors.append(f"{faculty.name}: {str(e)}")
-            
-            # Сохраняем изменения
-            await session.commit()
-            
-            # Отправляем результат
-            result_msg = f"✅ <b>Восстановление завершено!</b>\n\n"
-            result_msg += f"🔄 <b>Восстановлено записей:</b> {recovered_count}\n"
-            
-            if errors:
-                result_msg += f"\n❌ <b>Ошибки:</b>\n"
-                for error in errors[:5]:  # Показываем только первые 5 ошибок
-                    result_msg += f"• {error}\n"
-                if len(errors) > 5:
-                    result_msg += f"... и еще {len(errors) - 5} ошибок"
-            
-            await message.answer(result_msg, parse_mode="HTML")
+        
+        recovered_count = 0
+        errors = []
+        
+        # Исключаемые листы
+        excluded_sheets = {"Кандидаты", "Опытные собесеры", "Не опытные собесеры", "Записи_2"}
+        gc = await get_sheets_client()
+        spreadsheets_cache = await get_spreadsheets()
+        
+        for faculty in faculties:
+            if not faculty.google_sheet_url:
+                continue
+                
+            try:
+                book = await spreadsheets_cache.get(faculty.id, faculty.google_sheet_url)
+                user_sheets = [title for title in book.titles() if title not in excluded_sheets]
+                grids = await fetch_availability_grids(gc, book.spreadsheet_id, user_sheets)
+                
+                records = []
+                for rows in grids.values():
+                    try:
+                        user_id, cells = parse_availability_grid(rows)
+                    except ValueError:
+                        continue
+                    if user_id is not None:
+                        records.extend((user_id, date, time_slot) for date, time_slot in cells)
+                
+                # Недостающие ячейки факультета — одним INSERT ... ON CONFLICT DO NOTHING, своя короткая транзакция
+                async for session in get_session():
+                    recovered_count += await append_availability(session, faculty.id, records)
+                    await session.commit()
+                slot_interviewers.invalidate(faculty.id)
+            except Exception as e:
+                errors.append(f"{faculty.name}: {str(e)}")
+        
+        # Отправляем результат
+        result_msg = f"✅ <b>Восстановление завершено!</b>\n\n"
+        result_msg += f"🔄 <b>Восстановлено записей:</b> {recovered_count}\n"
+        
+        if errors:
+            result_msg += f"\n❌ <b>Ошибки:</b>\n"
+            for error in errors[:5]:  # Показываем только первые 5 ошибок
+                result_msg += f"• {error}\n"
+            if len(errors) > 5:
+                result_msg += f"... и еще {len(errors) - 5} ошибок"
+        
+        await message.answer(result_msg, parse_mode="HTML")
                 
     except Exception as e:
         import traceback
@@ -1775,20 +1414,9 @@ async def recover_missing_data(message: types.Message):
         await message.answer(f"❌ Ошибка при восстановлении:\n<pre>{e}\n{tb[-1000:]}</pre>")
 
 # --- Команда настройки времени блокировки слотов ---
-@dp.message(Command("create_time_delta"))
-async def create_time_delta(message: types.Message):
-    tg_id = str(message.from_user.id)
-    
+@dp.message(Command("create_time_delta"), is_faculty_admin)
+async def create_time_delta(message: types.Message, admin, faculty):
     async for session in get_session():
-        # Проверяем, что пользователь — админ факультета
-        result = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-        row = result.first()
-        if not row:
-            await message.answer("Вы не являетесь админом факультета или не привязаны к факультету.")
-            return
-        
-        admin, faculty = row
-        
         # Получаем текущее значение времени блокировки
         current_delta = await get_faculty_time_delta(session, faculty.id)
         
@@ -1807,21 +1435,10 @@ async def create_time_delta(message: types.Message):
             parse_mode="HTML"
         )
 
-@dp.callback_query(F.data.startswith("set_delta:"))
-async def set_time_delta(callback: CallbackQuery):
+@dp.callback_query(F.data.startswith("set_delta:"), is_faculty_admin)
+async def set_time_delta(callback: CallbackQuery, admin, faculty):
     hours = int(callback.data.split(":")[-1])
-    tg_id = str(callback.from_user.id)
-    
     async for session in get_session():
-        # Проверяем, что пользователь — админ факультета
-        result = await session.execute(select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id))
-        row = result.first()
-        if not row:
-            await callback.message.edit_text("Вы не являетесь админом факультета.")
-            return
-        
-        admin, faculty = row
-        
         # Обновляем или создаем запись времени блокировки
         stmt = insert(FacultyTimeDelta).values(
             faculty_id=faculty.id,
@@ -1832,6 +1449,7 @@ async def set_time_delta(callback: CallbackQuery):
         )
         await session.execute(stmt)
         await session.commit()
+        faculty_configs.set_hours(faculty.id, hours)
         
         await callback.message.edit_text(
             f"✅ <b>Время блокировки обновлено!</b>\n\n"
@@ -1848,10 +1466,10 @@ async def debug_availability(message: types.Message):
     
     # Проверяем доступ - только для конкретного пользователя
     if tg_id != "922109605":
-        await message.answer("У вас нет доступа к этой команде.")
+        outbox.post(message.chat.id, "У вас нет доступа к этой команде.")
         return
     
-    await message.answer("🔍 Начинаю отладку доступности собеседующих...")
+    outbox.post(message.chat.id, "🔍 Начинаю отладку доступности собеседующих...")
     
     try:
         async for session in get_session():
@@ -1863,7 +1481,7 @@ async def debug_availability(message: types.Message):
                 if not faculty.google_sheet_url:
                     continue
                 
-                await message.answer(f"🏛️ <b>Факультет: {faculty.name}</b>", parse_mode="HTML")
+                outbox.post(message.chat.id, f"🏛️ <b>Факультет: {faculty.name}</b>", parse_mode="HTML")
                 
                 # Получаем всех собеседующих факультета
                 result_sobesers = await session.execute(
@@ -1874,7 +1492,7 @@ async def debug_availability(message: types.Message):
                 )
                 all_sobesers = result_sobesers.scalars().all()
                 
-                await message.answer(f"📋 Всего собеседующих: {len(all_sobesers)}")
+                outbox.post(message.chat.id, f"📋 Всего собеседующих: {len(all_sobesers)}")
                 
                 # Проверяем доступность для каждого собеседующего
                 for sobeser in all_sobesers:
@@ -1892,72 +1510,39 @@ async def debug_availability(message: types.Message):
                         for avail in availabilities:
                             dates_times.append(f"{avail.date} {avail.time_slot}")
                         
-                        await message.answer(
+                        outbox.post(message.chat.id, 
                             f"👤 <b>{sobeser.first_name} {sobeser.last_name}</b>\n"
                             f"Доступен в: {', '.join(dates_times[:5])}{'...' if len(dates_times) > 5 else ''}",
                             parse_mode="HTML"
                         )
                     else:
-                        await message.answer(
+                        outbox.post(message.chat.id, 
                             f"👤 <b>{sobeser.first_name} {sobeser.last_name}</b> - НЕТ ДОСТУПНОСТИ",
                             parse_mode="HTML"
                         )
                 
-                await asyncio.sleep(1)  # Задержка между факультетами
                 
     except Exception as e:
         import traceback
         tb = traceback.format_exc()
-        await message.answer(f"❌ Ошибка при отладке:\n<pre>{e}\n{tb[-1000:]}</pre>")
+        outbox.post(message.chat.id, f"❌ Ошибка при отладке:\n<pre>{e}\n{tb[-1000:]}</pre>")
 
 
-@dp.message(Command("updatee_zapis"))
-async def updatee_zapis(message: Message):
-    tg_id = str(message.from_user.id)
+@dp.message(Command("updatee_zapis"), is_faculty_admin)
+async def updatee_zapis(message: Message, admin, faculty):
     await message.answer("Обновляю лист 'Записи_2' по всем текущим данным...")
     try:
         async for session in get_session():
-            # Проверяем, что пользователь — админ факультета
-            result = await session.execute(
-                select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id)
-            )
-            row = result.first()
-            if not row:
-                await message.answer("Вы не являетесь админом факультета или не привязаны к факультету.")
-                return
-            admin, faculty = row
             if not faculty.google_sheet_url:
                 await message.answer("У факультета не указана ссылка на Google-таблицу.")
                 return
 
-            import gspread
-            from gspread_formatting import DataValidationRule, BooleanCondition, set_data_validation_for_cell_range
-            gc = gspread.service_account(filename="credentials.json")
-            sh = gc.open_by_url(faculty.google_sheet_url)
-
-            # Удаляем старый лист "Записи_2", если есть
-            try:
-                ws = sh.worksheet("Записи_2")
-                sh.del_worksheet(ws)
-                await asyncio.sleep(3)
-            except Exception:
-                pass
-
-            # Создаём новый лист "Записи_2"
-            ws = sh.add_worksheet(title="Записи_2", rows="100", cols="10")
-            await asyncio.sleep(3)
-
-            # Заголовки
-            headers = ["ID", "Имя Фамилия", "Дата", "Время", "Собеседующий 1", "Собеседующий 2", "Любой собесер 1", "Любой собесер 2"]
-            ws.append_row(headers)
-            await asyncio.sleep(2)
-
             # Получаем все Записи_2 на собеседования по факультету
             result_regs = await session.execute(
                 select(InterviewRegistration, User)
                 .join(User, User.id == InterviewRegistration.user_id)
                 .where(InterviewRegistration.faculty_id == faculty.id, InterviewRegistration.canceled == False)
-                .order_by(InterviewRegistration.date, InterviewRegistration.time_slot)
+                .order_by(InterviewRegistration.slot_start, InterviewRegistration.date, InterviewRegistration.time_slot)
             )
             rows = result_regs.all()
 
@@ -1968,46 +1553,21 @@ async def updatee_zapis(message: Message):
             all_sobesers = result_all_sobesers.scalars().all()
             all_sobesers_names = [f"{s.first_name} {s.last_name}" for s in all_sobesers]
 
-            for idx, (reg, user) in enumerate(rows, start=2):
-                # Собесеры, которые могут в это время
-                result_avail = await session.execute(
-                    select(User).join(Availability, Availability.user_id == User.id).where(
-                        User.is_sobeser == True,
-                        User.faculty_id == faculty.id,
-                        Availability.date == reg.date,
-                        Availability.time_slot == reg.time_slot,
-                        Availability.is_available == True
-                    )
-                )
-                avail_sobesers = result_avail.scalars().all()
-                avail_names = [f"{s.first_name} {s.last_name}" for s in avail_sobesers]
-
-                row = [
-                    str(user.id),
-                    f"{user.first_name} {user.last_name}",
-                    reg.date,
-                    reg.time_slot,
-                    "", "", "", ""
-                ]
-                ws.append_row(row)
-                await asyncio.sleep(2)
-
-                # Дропдауны для E и F (только те, кто может)
-                if avail_names:
-                    rule_avail = DataValidationRule(
-                        BooleanCondition('ONE_OF_LIST', avail_names),
-                        showCustomUi=True
-                    )
-                    set_data_validation_for_cell_range(ws, f"E{idx}:F{idx}", rule_avail)
-                    await asyncio.sleep(2)
-                # Дропдауны для G и H — все собесеры факультета
-                if all_sobesers_names:
-                    rule_all = DataValidationRule(
-                        BooleanCondition('ONE_OF_LIST', all_sobesers_names),
-                        showCustomUi=True
-                    )
-                    set_data_validation_for_cell_range(ws, f"G{idx}:H{idx}", rule_all)
-                    await asyncio.sleep(2)
+            # Собесеры, которые могут в каждом слоте — один сгруппированный запрос на весь факультет
+            slots = await slot_interviewers.get(session, faculty.id)
+            booking_rows = []
+            for reg, user in rows:
+                booking_rows.append(BookingRow(
+                    user_id=user.id,
+                    full_name=f"{user.first_name} {user.last_name}",
+                    date=reg.date,
+                    time_slot=reg.time_slot,
+                    avail_names=slots.get((reg.date, reg.time_slot), []),
+                    all_names=all_sobesers_names
+                ))
+
+            # Лист пересоздаётся целиком за три запроса к API, независимо от числа записей
+            await (await get_booking_sheet_sync()).rebuild(faculty.id, faculty.google_sheet_url, booking_rows)
 
             await message.answer(f"Лист 'Записи_2' успешно обновлён! Всего записей: {len(rows)}")
     except Exception as e:
@@ -2017,95 +1577,65 @@ async def updatee_zapis(message: Message):
 
 
 
-@dp.message(Command("recover_missing_slots"))
-async def recover_missing_slots(message: Message):
-    tg_id = str(message.from_user.id)
-    await message.answer("🔄 Начинаю восстановление недостающих слотов...")
+@dp.message(Command("recover_missing_slots"), is_faculty_admin)
+async def recover_missing_slots(message: Message, admin, faculty):
+    outbox.post(message.chat.id, "🔄 Начинаю восстановление недостающих слотов...")
     try:
         async for session in get_session():
-            # Проверяем, что пользователь — админ факультета
-            result = await session.execute(
-                select(User, Faculty).join(Faculty, Faculty.admin_id == User.id).where(User.tg_id == tg_id)
-            )
-            row = result.first()
-            if not row:
-                await message.answer("Вы не являетесь админом факультета или не привязаны к факультету.")
-                return
-            admin, faculty = row
             if not faculty.google_sheet_url:
-                await message.answer("У факультета не указана ссылка на Google-таблицу.")
+                outbox.post(message.chat.id, "У факультета не указана ссылка на Google-таблицу.")
                 return
 
-            import gspread
-            gc = gspread.service_account(filename="credentials.json")
-            sh = gc.open_by_url(faculty.google_sheet_url)
+            gc = await get_sheets_client()
+            book = await (await get_spreadsheets()).get(faculty.id, faculty.google_sheet_url)
+            sh = book.spreadsheet_id
             exclude = {"Кандидаты", "Опытные собесеры", "Не опытные собесеры", "Записи_2"}
-            sheets = [ws for ws in sh.worksheets() if ws.title not in exclude]
+            sheets = [title for title in book.titles() if title not in exclude]
 
             total_pages = len(sheets)
             total_in_db = 0
             total_missing = 0
             total_added = 0
+            # Сетки всех листов одним batchGet на пачку листов
+            grids = await fetch_availability_grids(gc, sh, sheets)
+            # Имена собесеров и тех, у кого уже есть занятость, — двумя запросами на весь факультет
+            result_names = await session.execute(
+                select(User.id, User.first_name, User.last_name).where(User.faculty_id == faculty.id)
+            )
+            names = {uid: f"{first} {last}" for uid, first, last in result_names.all()}
+            result_in_db = await session.execute(
+                select(Availability.user_id).where(Availability.faculty_id == faculty.id).distinct()
+            )
+            users_in_db = set(result_in_db.scalars().all())
+            records = []
 
-            for ws in sheets:
+            for title in sheets:
                 try:
-                    user_id_cell = ws.acell("A15").value
-                    if not user_id_cell:
-                        await message.answer(f"⏩ Пропущен лист <b>{ws.title}</b>: нет ID в A15.")
-                        await asyncio.sleep(1)
+                    user_id, cells = parse_availability_grid(grids.get(title, []))
+                    if user_id is None:
+                        outbox.post(message.chat.id, f"⏩ Пропущен лист <b>{title}</b>: нет ID в A15.")
                         continue
-                    user_id = int(user_id_cell)
-                    # Получаем имя и фамилию пользователя
-                    user = await session.scalar(select(User).where(User.id == user_id))
-                    user_name = f"{user.first_name} {user.last_name}" if user else f"ID {user_id}"
-                    # Проверяем, есть ли хоть одна запись в availability для этого user_id и факультета
-                    exists = await session.scalar(
-                        select(Availability).where(
-                            Availability.user_id == user_id,
-                            Availability.faculty_id == faculty.id
-                        )
-                    )
-                    if exists:
+                    user_name = names.get(user_id, f"ID {user_id}")
+                    # Есть ли хоть одна запись в availability для этого user_id и факультета
+                    if user_id in users_in_db:
                         total_in_db += 1
-                        await message.answer(f"✅ <b>{user_name}</b> — уже есть в базе.")
-                        await asyncio.sleep(1)
+                        outbox.post(message.chat.id, f"✅ <b>{user_name}</b> — уже есть в базе.")
                         continue  # Уже есть, пропускаем
-                    # Парсим даты и интервалы
-                    date_cells = ws.range("B1:I1")
-                    date_values = [cell.value for cell in date_cells]
-                    time_cells = ws.range("A2:A13")
-                    time_values = [cell.value for cell in time_cells]
-                    grid = ws.range("B2:I13")
-                    added_for_page = 0
-                    for i, cell in enumerate(grid):
-                        row = i // 8
-                        col = i % 8
-                        value = cell.value.strip().lower()
-                        if value == "могу":
-                            date = date_values[col]
-                            time_slot = time_values[row]
-                            stmt = insert(Availability).values(
-                                user_id=user_id,
-                                faculty_id=faculty.id,
-                                date=date,
-                                time_slot=time_slot,
-                                is_available=True
-                            ).on_conflict_do_nothing()
-                            await session.execute(stmt)
-                            added_for_page += 1
+                    # Строки копятся и загружаются одним COPY после обхода всех листов
+                    records.extend((user_id, date, time_slot) for date, time_slot in cells)
+                    added_for_page = len(cells)
                     if added_for_page > 0:
                         total_missing += 1
-                        total_added += added_for_page
-                        await message.answer(f"➕ <b>{user_name}</b>: добавлено <b>{added_for_page}</b> отметок 'могу'.")
+                        outbox.post(message.chat.id, f"➕ <b>{user_name}</b>: добавлено <b>{added_for_page}</b> отметок 'могу'.")
                     else:
-                        await message.answer(f"⚠️ <b>{user_name}</b>: не найдено новых отметок 'могу'.")
-                    await asyncio.sleep(3)
+                        outbox.post(message.chat.id, f"⚠️ <b>{user_name}</b>: не найдено новых отметок 'могу'.")
                 except Exception as e:
-                    await message.answer(f"❌ Ошибка на листе <b>{ws.title}</b>: {e}")
-                    await asyncio.sleep(2)
+                    outbox.post(message.chat.id, f"❌ Ошибка на листе <b>{title}</b>: {e}")
                     continue
+            total_added = await append_availability(session, faculty.id, records)
             await session.commit()
-            await message.answer(
+            slot_interviewers.invalidate(faculty.id)
+            outbox.post(message.chat.id, 
                 f"✅ Восстановление завершено!\n\n"
                 f"Всего страниц: <b>{total_pages}</b>\n"
                 f"Уже есть в базе: <b>{total_in_db}</b>\n"
@@ -2116,12 +1646,40 @@ async def recover_missing_slots(message: Message):
     except Exception as e:
         import traceback
         tb = traceback.format_exc()
-        await message.answer(f"Ошибка при восстановлении:\n<pre>{e}\n{tb[-1500:]}</pre>")
+        outbox.post(message.chat.id, f"Ошибка при восстановлении:\n<pre>{e}\n{tb[-1500:]}</pre>")
 
 
 
 async def main():
-	await dp.start_polling(bot)
+	# Прогреваем счётчики мест до приёма обновлений
+	async for session in get_session():
+		await faculty_configs.load(session)
+		faculty_ids = (await session.execute(select(Faculty.id))).scalars().all()
+		await (await get_seat_counters()).warm_all(session, faculty_ids)
+	if REMINDER_HOURS > 0:
+		reminders.start()
+	try:
+		if BOT_MODE == "webhook":
+			await run_webhook(
+				dp, bot, WEBHOOK_URL,
+				path=WEBHOOK_PATH,
+				host=WEBHOOK_HOST,
+				port=WEBHOOK_PORT,
+				secret_token=WEBHOOK_SECRET,
+				concurrency=WEBHOOK_CONCURRENCY
+			)
+		else:
+			# Оставшийся от webhook-режима вебхук не даст getUpdates работать
+			await bot.delete_webhook()
+			await dp.start_polling(bot)
+	finally:
+		# Досылаем сообщения из очереди и дописываем в таблицы всё, что осталось в буфере
+		await reminders.close()
+		await outbox.close()
+		if booking_sheet_sync is not None:
+			await booking_sheet_sync.close()
+		if sheets_client is not None:
+			await sheets_client.close()
 
 if __name__ == "__main__":
 	asyncio.run(main())
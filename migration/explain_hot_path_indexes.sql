@@ -0,0 +1,115 @@
+-- Планы горячих запросов до и после hot_path_indexes_2025 на синтетической кампании.
+--
+-- Запуск на пустой (не боевой) базе:
+--   psql -d scratch -f migration/explain_hot_path_indexes.sql > migration/explain_hot_path_indexes.out
+-- Всё создаётся в схеме explain_hot_paths и удаляется в конце.
+--
+-- Объёмы: 30 факультетов, по 100 собесеров и ~670 кандидатов на факультет;
+-- у каждого собесера 8 дат x 12 часовых интервалов, 'могу' примерно в 40% ячеек;
+-- даты подписаны настоящими днями недели, как в листах ("26.09(пт)"), а сетка
+-- у факультетов начинается в разное время (08:00-11:30), как у разных кампусов;
+-- 20000 записей на собеседование, 10% отменены.
+
+DROP SCHEMA IF EXISTS explain_hot_paths CASCADE;
+CREATE SCHEMA explain_hot_paths;
+SET search_path = explain_hot_paths;
+SELECT setseed(0.42);
+
+CREATE TABLE users (
+    id serial PRIMARY KEY,
+    first_name varchar(100),
+    last_name varchar(100),
+    tg_id varchar(100) UNIQUE,
+    is_candidate boolean DEFAULT false,
+    is_sobeser boolean DEFAULT false,
+    is_admin_faculty boolean DEFAULT false,
+    faculty_id integer
+);
+CREATE TABLE availability (
+    id serial PRIMARY KEY,
+    user_id integer NOT NULL,
+    faculty_id integer NOT NULL,
+    date varchar(20) NOT NULL,
+    time_slot varchar(20) NOT NULL,
+    is_available boolean DEFAULT true
+);
+CREATE TABLE interview_registrations (
+    id serial PRIMARY KEY,
+    user_id integer NOT NULL,
+    faculty_id integer NOT NULL,
+    date varchar(20) NOT NULL,
+    time_slot varchar(20) NOT NULL,
+    created_at timestamp DEFAULT now(),
+    canceled boolean DEFAULT false
+);
+-- Частичный уникальный индекс уже был до миграции (active_registration_unique_2025)
+CREATE UNIQUE INDEX uq_interview_registrations_user_active
+    ON interview_registrations (user_id) WHERE NOT canceled;
+
+-- Собесеры: id 1..3000, факультет (id - 1) / 100 + 1
+INSERT INTO users (first_name, last_name, tg_id, is_sobeser, faculty_id)
+SELECT 'Собес' || g, 'Фамилия' || g, 's' || g, true, (g - 1) / 100 + 1
+FROM generate_series(1, 3000) g;
+-- Кандидаты
+INSERT INTO users (first_name, last_name, tg_id, is_candidate, faculty_id)
+SELECT 'Канд' || g, 'Фамилия' || g, 'c' || g, true, g % 30 + 1
+FROM generate_series(1, 20000) g;
+
+-- Сетка факультета: 8 дней с 26.09 и 12 часовых интервалов от его времени начала
+CREATE TEMP TABLE grid AS
+SELECT f AS faculty_id,
+       row_number() OVER (PARTITION BY f ORDER BY d, t) - 1 AS n,
+       to_char(day, 'DD.MM') || '(' || (ARRAY['пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс'])[extract(isodow FROM day)] || ')' AS date,
+       to_char(start, 'HH24:MI') || ' - ' || to_char(start + interval '1 hour', 'HH24:MI') AS time_slot
+FROM generate_series(1, 30) f,
+     generate_series(0, 7) d,
+     generate_series(0, 11) t,
+     LATERAL (SELECT date '2025-09-26' + d AS day,
+                     time '08:00' + (f % 4) * interval '1 hour' + (f % 2) * interval '30 minutes'
+                         + t * interval '1 hour' AS start) s;
+
+INSERT INTO availability (user_id, faculty_id, date, time_slot, is_available)
+SELECT u.id, u.faculty_id, g.date, g.time_slot, true
+FROM users u JOIN grid g ON g.faculty_id = u.faculty_id
+WHERE u.is_sobeser AND random() < 0.4;
+
+INSERT INTO interview_registrations (user_id, faculty_id, date, time_slot, canceled)
+SELECT c.id, c.faculty_id, g.date, g.time_slot, false
+FROM (SELECT id, faculty_id, floor(random() * 96)::int AS n FROM users WHERE is_candidate) c
+JOIN grid g ON g.faculty_id = c.faculty_id AND g.n = c.n;
+UPDATE interview_registrations SET canceled = true WHERE id % 10 = 0;
+
+VACUUM ANALYZE users;
+VACUUM ANALYZE availability;
+VACUUM ANALYZE interview_registrations;
+
+\echo '=== ДО: без индексов hot_path_indexes_2025 ==='
+\set q1 'SELECT user_id FROM availability WHERE faculty_id = 7 AND date = ''28.09(вс)'' AND time_slot = ''13:30 - 14:30'' AND is_available'
+\set q2 'SELECT id, user_id, date, time_slot FROM availability WHERE faculty_id = 7 AND user_id IN (601, 602, 650, 699)'
+\set q3 'SELECT count(*) FROM interview_registrations WHERE faculty_id = 7 AND NOT canceled AND date = ''28.09(вс)'' AND time_slot = ''13:30 - 14:30'''
+\set q4 'SELECT first_name, last_name FROM users WHERE faculty_id = 7 AND is_sobeser'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) :q1;
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) :q2;
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) :q3;
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) :q4;
+
+-- Те же индексы, что создаёт hot_path_indexes_2025
+CREATE INDEX ix_availability_faculty_slot_available
+    ON availability (faculty_id, date, time_slot) INCLUDE (user_id) WHERE is_available;
+CREATE INDEX ix_availability_faculty_user ON availability (faculty_id, user_id);
+CREATE INDEX ix_interview_registrations_faculty_slot_active
+    ON interview_registrations (faculty_id, date, time_slot) WHERE NOT canceled;
+CREATE INDEX ix_users_faculty_sobeser
+    ON users (faculty_id) INCLUDE (first_name, last_name) WHERE is_sobeser;
+VACUUM ANALYZE users;
+VACUUM ANALYZE availability;
+VACUUM ANALYZE interview_registrations;
+
+\echo '=== ПОСЛЕ ==='
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) :q1;
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) :q2;
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) :q3;
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) :q4;
+
+RESET search_path;
+DROP SCHEMA explain_hot_paths CASCADE;
@@ -0,0 +1,52 @@
+"""
+add partial unique index on active interview_registrations(user_id)
+
+Revision ID: active_registration_unique_2025
+Revises: add_faculty_time_delta_table
+Create Date: 2025-09-27
+"""
+revision = 'active_registration_unique_2025'
+down_revision = 'add_faculty_time_delta_table'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    # Дубли, появившиеся из-за гонки при записи: оставляем самую раннюю активную
+    # запись, а места отменённых возвращаем в slot_limits тем же запросом
+    op.execute(
+        """
+        WITH canceled AS (
+            UPDATE interview_registrations r
+            SET canceled = true
+            WHERE NOT r.canceled
+              AND EXISTS (
+                  SELECT 1 FROM interview_registrations o
+                  WHERE o.user_id = r.user_id AND NOT o.canceled AND o.id < r.id
+              )
+            RETURNING r.faculty_id, r.date, r.time_slot
+        ), freed AS (
+            SELECT faculty_id, date, time_slot, count(*) AS seats
+            FROM canceled
+            GROUP BY faculty_id, date, time_slot
+        )
+        UPDATE slot_limits sl
+        SET "limit" = sl."limit" + freed.seats
+        FROM freed
+        WHERE sl.faculty_id = freed.faculty_id
+          AND sl.date = freed.date
+          AND sl.time_slot = freed.time_slot
+        """
+    )
+    op.create_index(
+        "uq_interview_registrations_user_active",
+        "interview_registrations",
+        ["user_id"],
+        unique=True,
+        postgresql_where=sa.text("NOT canceled")
+    )
+
+def downgrade():
+    op.drop_index("uq_interview_registrations_user_active", table_name="interview_registrations")
@@ -0,0 +1,28 @@
+"""
+add availability_sheet_hashes table
+
+Revision ID: availability_sheet_hashes_2025
+Revises: active_registration_unique_2025
+Create Date: 2025-09-28
+"""
+revision = 'availability_sheet_hashes_2025'
+down_revision = 'active_registration_unique_2025'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'availability_sheet_hashes',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('faculty_id', sa.Integer(), sa.ForeignKey('faculties.id'), nullable=False),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('synced_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('faculty_id', 'user_id', name='uq_availability_sheet_hashes_faculty_user')
+    )
+
+def downgrade():
+    op.drop_table('availability_sheet_hashes')
@@ -0,0 +1,75 @@
+"""
+add unique constraint on availability (faculty_id, user_id, date, time_slot)
+
+Revision ID: availability_unique_cell_2025
+Revises: registration_reminders_2025
+Create Date: 2025-09-30
+
+Дубли ячеек удаляются (остаётся строка с наименьшим id), уникальный
+индекс строится CONCURRENTLY и затем становится ограничением — загрузка
+занятости может писать через ON CONFLICT DO NOTHING. Ограничение
+начинается с (faculty_id, user_id), поэтому ix_availability_faculty_user
+становится лишним и удаляется.
+
+Между удалением дублей и построением индекса старый код ещё может
+вставить дубль — тогда CONCURRENTLY оставит INVALID индекс и миграция
+упадёт. Повторный запуск снова чистит дубли, удаляет невалидный индекс
+и строит его заново.
+
+downgrade удаляет ограничение и возвращает ix_availability_faculty_user,
+но удалённые дубли не восстанавливает.
+"""
+revision = 'availability_unique_cell_2025'
+down_revision = 'registration_reminders_2025'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+INDEX_NAME = "uq_availability_faculty_user_slot"
+
+
+def _index_is_invalid(name):
+    return op.get_bind().execute(sa.text(
+        "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+    ), {"name": name}).scalar()
+
+
+def upgrade():
+    op.execute("""
+        DELETE FROM availability a
+        USING availability b
+        WHERE a.faculty_id = b.faculty_id
+          AND a.user_id = b.user_id
+          AND a.date = b.date
+          AND a.time_slot = b.time_slot
+          AND a.id > b.id
+    """)
+    with op.get_context().autocommit_block():
+        # Остаток прошлой неудачной попытки
+        if _index_is_invalid(INDEX_NAME):
+            op.drop_index(INDEX_NAME, table_name="availability", postgresql_concurrently=True)
+        op.create_index(
+            INDEX_NAME,
+            "availability",
+            ["faculty_id", "user_id", "date", "time_slot"],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+    op.execute(f"ALTER TABLE availability ADD CONSTRAINT {INDEX_NAME} UNIQUE USING INDEX {INDEX_NAME}")
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_availability_faculty_user", table_name="availability", postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_availability_faculty_user",
+            "availability",
+            ["faculty_id", "user_id"],
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+    op.drop_constraint(INDEX_NAME, "availability", type_="unique")
@@ -0,0 +1,33 @@
+"""
+add interview_registrations.reminded_at and reminder due-time index
+
+Revision ID: registration_reminders_2025
+Revises: typed_slot_start_2025
+Create Date: 2025-09-29
+"""
+revision = 'registration_reminders_2025'
+down_revision = 'typed_slot_start_2025'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.add_column('interview_registrations', sa.Column('reminded_at', sa.DateTime(), nullable=True))
+    # Уже прошедшие собеседования напоминаний не ждут
+    op.execute("UPDATE interview_registrations SET reminded_at = now() WHERE slot_start <= localtimestamp")
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_interview_registrations_reminder_due",
+            "interview_registrations",
+            ["slot_start"],
+            postgresql_where=sa.text("reminded_at IS NULL AND NOT canceled"),
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_interview_registrations_reminder_due", table_name="interview_registrations", postgresql_concurrently=True, if_exists=True)
+    op.drop_column('interview_registrations', 'reminded_at')
@@ -0,0 +1,104 @@
+"""
+add typed slot_date/start_time/slot_start to availability, slot_limits and interview_registrations
+
+Revision ID: typed_slot_start_2025
+Revises: hot_path_indexes_2025
+Create Date: 2025-09-28
+
+Строковые date ("26.09(пт)") и time_slot ("10:00 - 11:00") остаются как
+есть — на них завязаны callback_data, Redis и Google-таблицы. Типизированные
+колонки заполняет триггер при любой вставке или изменении date/time_slot,
+поэтому ни один путь записи (ORM, INSERT ... SELECT, COPY) их не пропустит.
+Год, как и в боте, берётся текущий.
+"""
+revision = 'typed_slot_start_2025'
+down_revision = 'hot_path_indexes_2025'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+TABLES = ("availability", "slot_limits", "interview_registrations")
+
+FILL_SLOT_START = r"""
+CREATE OR REPLACE FUNCTION fill_slot_start() RETURNS trigger AS $$
+DECLARE
+    part text;
+    y int;
+    m int;
+    d int;
+    hh int;
+    mi int;
+BEGIN
+    -- Без EXCEPTION-блоков: каждый из них — подтранзакция на строку, а триггер
+    -- срабатывает и на COPY/executemany. Что не проходит проверки, даёт NULL.
+    NEW.slot_date := NULL;
+    part := substring(NEW.date FROM '^\d{2}\.\d{2}');
+    IF part IS NOT NULL THEN
+        y := extract(year FROM now());
+        m := substr(part, 4, 2);
+        d := substr(part, 1, 2);
+    ELSE
+        part := substring(NEW.date FROM '^\d{4}-\d{2}-\d{2}');
+        IF part IS NOT NULL THEN
+            y := substr(part, 1, 4);
+            m := substr(part, 6, 2);
+            d := substr(part, 9, 2);
+        END IF;
+    END IF;
+    IF part IS NOT NULL AND y >= 1 AND m BETWEEN 1 AND 12 AND d BETWEEN 1 AND 31 THEN
+        NEW.slot_date := make_date(y, m, 1) + (d - 1);
+        -- 31.02 и подобные перескочили бы в следующий месяц
+        IF extract(month FROM NEW.slot_date) <> m THEN
+            NEW.slot_date := NULL;
+        END IF;
+    END IF;
+    NEW.start_time := NULL;
+    part := substring(NEW.time_slot FROM '^\s*(\d{1,2}:\d{2})');
+    IF part IS NOT NULL THEN
+        hh := split_part(part, ':', 1);
+        mi := split_part(part, ':', 2);
+        IF hh < 24 AND mi < 60 THEN
+            NEW.start_time := make_time(hh, mi, 0);
+        END IF;
+    END IF;
+    NEW.slot_start := NEW.slot_date + coalesce(NEW.start_time, time '00:00');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+def upgrade():
+    op.execute(FILL_SLOT_START)
+    for table in TABLES:
+        op.add_column(table, sa.Column('slot_date', sa.Date(), nullable=True))
+        op.add_column(table, sa.Column('start_time', sa.Time(), nullable=True))
+        op.add_column(table, sa.Column('slot_start', sa.DateTime(), nullable=True))
+        op.execute(
+            f"CREATE TRIGGER {table}_fill_slot_start "
+            f"BEFORE INSERT OR UPDATE OF date, time_slot ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION fill_slot_start()"
+        )
+        # Бэкфилл: UPDATE OF date запускает тот же триггер
+        op.execute(f"UPDATE {table} SET date = date")
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index(
+                f"ix_{table}_faculty_slot_start",
+                table,
+                ["faculty_id", "slot_start"],
+                postgresql_concurrently=True,
+                if_not_exists=True
+            )
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.drop_index(f"ix_{table}_faculty_slot_start", table_name=table, postgresql_concurrently=True, if_exists=True)
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_fill_slot_start ON {table}")
+        op.drop_column(table, 'slot_start')
+        op.drop_column(table, 'start_time')
+        op.drop_column(table, 'slot_date')
+    op.execute("DROP FUNCTION IF EXISTS fill_slot_start()")
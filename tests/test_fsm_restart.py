@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from aiogram.fsm.storage.base import StorageKey
+
+from bot.fsm import create_dispatcher, InterviewFSM, CancelFSM
+
+BOT_ID = 42
+TTL = 3600
+
+
+def _key(user_id):
+    return StorageKey(bot_id=BOT_ID, chat_id=user_id, user_id=user_id)
+
+
+def test_fsm_state_survives_restart():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        before = create_dispatcher("redis", fakeredis.FakeAsyncRedis(server=server), TTL).storage
+        await before.set_state(_key(1), InterviewFSM.choosing_time)
+        await before.set_data(_key(1), {"date": "26.09(пт)"})
+        await before.set_state(_key(2), CancelFSM.waiting_reason)
+        await before.set_data(_key(2), {"registration_id": 17})
+        await before.close()
+
+        # Новый процесс бота: новое подключение к тому же Redis
+        redis_client = fakeredis.FakeAsyncRedis(server=server)
+        after = create_dispatcher("redis", redis_client, TTL).storage
+        assert await after.get_state(_key(1)) == InterviewFSM.choosing_time.state
+        assert await after.get_data(_key(1)) == {"date": "26.09(пт)"}
+        assert await after.get_state(_key(2)) == CancelFSM.waiting_reason.state
+        assert await after.get_data(_key(2)) == {"registration_id": 17}
+        for part in ("state", "data"):
+            ttl = await redis_client.ttl(after.key_builder.build(_key(2), part))
+            assert 0 < ttl <= TTL
+        await after.close()
+
+    asyncio.run(scenario())
+
+
+def test_memory_storage_by_default():
+    dp = create_dispatcher()
+    assert type(dp.storage).__name__ == "MemoryStorage"
@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendPhoto
+from aiogram.types import FSInputFile
+
+from bot.media import MediaCache
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class FakeMessage:
+    def __init__(self, rejected=()):
+        self.uploads = 0
+        self.sent = []
+        self.rejected = set(rejected)
+
+    async def answer_photo(self, photo, **kwargs):
+        if isinstance(photo, FSInputFile):
+            # Загрузка медленная: остальные обработчики успевают прийти за тем же файлом
+            await asyncio.sleep(0.05)
+            self.uploads += 1
+            photo = f"file-{self.uploads}"
+        elif photo in self.rejected:
+            raise TelegramBadRequest(SendPhoto(chat_id=1, photo=photo), "wrong file identifier")
+        self.sent.append(photo)
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=photo)])
+
+
+def test_concurrent_first_sends_upload_once(tmp_path):
+    image = tmp_path / "image.png"
+    image.write_bytes(b"png")
+
+    async def scenario():
+        cache = MediaCache(fakeredis.FakeAsyncRedis(decode_responses=True))
+        message = FakeMessage()
+        await asyncio.gather(*(cache.answer_photo(message, str(image)) for _ in range(10)))
+        return message
+
+    message = asyncio.run(scenario())
+    assert message.uploads == 1
+    assert message.sent == ["file-1"] * 10
+
+
+def test_rejected_file_id_is_uploaded_once(tmp_path):
+    image = tmp_path / "image.png"
+    image.write_bytes(b"png")
+
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        cache = MediaCache(redis)
+        key = await cache._key(str(image))
+        await redis.set(key, "expired")
+        message = FakeMessage(rejected={"expired"})
+        await asyncio.gather(*(cache.answer_photo(message, str(image)) for _ in range(5)))
+        return message, await redis.get(key)
+
+    message, stored = asyncio.run(scenario())
+    assert message.uploads == 1
+    assert message.sent == ["file-1"] * 5
+    assert stored == "file-1"
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+from bot.outbox import Outbox, MAX_MESSAGE_LENGTH
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []  # (chat_id, text, kwargs, monotonic)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text, kwargs, time.monotonic()))
+        return len(self.sent)
+
+
+def test_mixed_chat_id_types_share_one_queue():
+    async def scenario():
+        bot = FakeBot()
+        outbox = Outbox(bot, per_chat_interval=0.05)
+        futures = [
+            outbox.post("922109605", "a"),
+            outbox.post("111", "b"),
+            outbox.post(922109605, "c"),
+        ]
+        await asyncio.gather(*futures)
+        await outbox.close()
+        return bot.sent
+
+    sent = asyncio.run(scenario())
+    by_chat = {chat_id: text for chat_id, text, _, _ in sent}
+    assert len(sent) == 2
+    assert by_chat == {922109605: "a\n\nc", 111: "b"}
+
+
+def test_per_chat_order_and_interval():
+    async def scenario():
+        bot = FakeBot()
+        outbox = Outbox(bot, per_chat_interval=0.05)
+        # С клавиатурой сообщения не склеиваются
+        futures = [outbox.post(1, str(i), reply_markup=None) for i in range(4)]
+        await asyncio.gather(*futures)
+        await outbox.close()
+        return bot.sent
+
+    sent = asyncio.run(scenario())
+    assert [text for _, text, _, _ in sent] == ["0", "1", "2", "3"]
+    gaps = [b[3] - a[3] for a, b in zip(sent, sent[1:])]
+    assert all(gap >= 0.045 for gap in gaps)
+
+
+def test_coalescing_respects_message_limit():
+    async def scenario():
+        bot = FakeBot()
+        outbox = Outbox(bot, per_chat_interval=0.01)
+        chunk = "x" * 1500
+        futures = [outbox.post(5, chunk) for _ in range(5)]
+        results = await asyncio.gather(*futures)
+        await outbox.close()
+        return bot.sent, results
+
+    sent, results = asyncio.run(scenario())
+    assert all(len(text) <= MAX_MESSAGE_LENGTH for _, text, _, _ in sent)
+    assert "".join(text for _, text, _, _ in sent).count("x") == 5 * 1500
+    # Склеенные сообщения разрешаются одним и тем же отправленным Message
+    assert results[0] == results[1]
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import redis.asyncio as redis
+
+from bot.sheet_sync import BookingSheetSync
+
+
+def test_sheet_lock_is_renewed_while_held():
+    async def scenario():
+        redis_client = fakeredis.FakeAsyncRedis()
+        sync = BookingSheetSync(None, None, redis_client=redis_client, lock_ttl=0.3)
+        async with sync._sheet_lock(5):
+            # Дольше нескольких TTL — как пауза регулятора квоты посреди записи
+            await asyncio.sleep(1.0)
+            other = redis_client.lock("lock:sheet_sync:5", timeout=1, blocking_timeout=0.05)
+            assert not await other.acquire()
+        other = redis_client.lock("lock:sheet_sync:5", timeout=1, blocking_timeout=0.05)
+        assert await other.acquire()
+        await other.release()
+
+    asyncio.run(scenario())
+
+
+def test_sheet_lock_falls_back_to_local_lock_when_redis_is_down():
+    async def scenario():
+        # Порт, на котором никто не слушает
+        redis_client = redis.Redis(host="127.0.0.1", port=1, socket_connect_timeout=0.2)
+        sync = BookingSheetSync(None, None, redis_client=redis_client)
+        order = []
+
+        async def write(name):
+            async with sync._sheet_lock(7):
+                order.append(f"{name}:start")
+                await asyncio.sleep(0.05)
+                order.append(f"{name}:end")
+
+        await asyncio.gather(write("a"), write("b"))
+        await redis_client.aclose()
+        return order
+
+    # Запись идёт, а записи одного факультета не пересекаются и без Redis
+    assert asyncio.run(scenario()) == ["a:start", "a:end", "b:start", "b:end"]
+
+
+def test_sheet_lock_without_redis():
+    async def scenario():
+        sync = BookingSheetSync(None, None)
+        async with sync._sheet_lock(1):
+            return True
+
+    assert asyncio.run(scenario())
@@ -0,0 +1,116 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.webhook import create_webhook_app
+
+SECRET = "test-secret"
+
+
+def _update(update_id, text="hi"):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Тест"},
+            "text": text,
+        },
+    }
+
+
+async def _post(client, update):
+    resp = await client.post("/webhook", json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+    assert resp.status == 200
+    return resp
+
+
+def _client(dispatcher, concurrency=32, drain_timeout=5):
+    bot = Bot("42:TEST")
+    app, handler = create_webhook_app(
+        dispatcher, bot, secret_token=SECRET, concurrency=concurrency, drain_timeout=drain_timeout
+    )
+    return TestClient(TestServer(app)), handler
+
+
+def test_update_is_dispatched():
+    async def scenario():
+        dp = Dispatcher()
+        seen = asyncio.Queue()
+
+        @dp.message()
+        async def on_message(message):
+            await seen.put(message.text)
+
+        client, _ = _client(dp)
+        async with client:
+            await _post(client, _update(1, "привет"))
+            return await asyncio.wait_for(seen.get(), 2)
+
+    assert asyncio.run(scenario()) == "привет"
+
+
+def test_wrong_secret_is_rejected():
+    async def scenario():
+        client, _ = _client(Dispatcher())
+        async with client:
+            resp = await client.post("/webhook", json=_update(1), headers={"X-Telegram-Bot-Api-Secret-Token": "nope"})
+            return resp.status
+
+    assert asyncio.run(scenario()) == 401
+
+
+def test_concurrency_is_bounded():
+    async def scenario():
+        dp = Dispatcher()
+        release = asyncio.Event()
+        running = 0
+        peak = 0
+        done = []
+
+        @dp.message()
+        async def on_message(message):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await release.wait()
+            running -= 1
+            done.append(message.message_id)
+
+        client, handler = _client(dp, concurrency=2)
+        async with client:
+            # Telegram получает ответ сразу, даже когда все места заняты
+            for i in range(1, 6):
+                await asyncio.wait_for(_post(client, _update(i)), 1)
+            await asyncio.sleep(0.1)
+            assert running == 2
+            release.set()
+            await handler.drain(2)
+        return peak, sorted(done)
+
+    peak, done = asyncio.run(scenario())
+    assert peak == 2
+    assert done == [1, 2, 3, 4, 5]
+
+
+def test_shutdown_drains_accepted_updates():
+    async def scenario():
+        dp = Dispatcher()
+        done = []
+
+        @dp.message()
+        async def on_message(message):
+            await asyncio.sleep(0.2)
+            done.append(message.message_id)
+
+        client, _ = _client(dp)
+        async with client:
+            await _post(client, _update(1))
+            await _post(client, _update(2))
+            assert done == []
+        # Выход из клиента останавливает приложение: on_shutdown ждёт принятые апдейты
+        return sorted(done)
+
+    assert asyncio.run(scenario()) == [1, 2]